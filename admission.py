@@ -0,0 +1,143 @@
+import os
+import shutil
+
+from starlette.responses import JSONResponse
+
+import metrics
+
+# Limits for the upload endpoints, all overridable from the environment.
+# Requests past them get a 503 with Retry-After instead of piling up
+# in memory; one that could never fit gets a 413.
+MAX_REQUESTS = int(os.environ.get("WJIV_MAX_REQUESTS", 4))
+MAX_BYTES_IN_FLIGHT = int(os.environ.get("WJIV_MAX_BYTES_IN_FLIGHT", 256 * 1024 * 1024))
+MAX_FILES_PER_REQUEST = int(os.environ.get("WJIV_MAX_FILES_PER_REQUEST", 500))
+RETRY_AFTER_SECONDS = int(os.environ.get("WJIV_RETRY_AFTER_SECONDS", 10))
+
+# Uploads are copied to disk in pieces of this size
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+UPLOAD_ENDPOINTS = ("/process_wjiv", "/process_speakcat_excel", "/wjiv_jobs", "/debug/profile")
+
+
+class Rejected(Exception):
+
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+
+
+class Admission():
+    # Bounds the upload requests being handled at once and the bytes they
+    # carry. A request is counted from before its body is read until its
+    # response (streamed ones included) has been sent. Everything runs on
+    # the event loop, so no locking.
+
+    def __init__(self, max_requests: int = MAX_REQUESTS, max_bytes: int = MAX_BYTES_IN_FLIGHT):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.active = 0
+        self.bytes_in_flight = 0
+        self.rejected = {}
+
+    def acquire(self, endpoint: str, size: int):
+        if size > self.max_bytes:
+            self._reject(endpoint, Rejected(
+                413, "too_large", f"Upload of {size} bytes is over the {self.max_bytes} byte limit"))
+        if self.active >= self.max_requests:
+            self._reject(endpoint, Rejected(
+                503, "busy", f"{self.active} uploads already being processed, try again later"))
+        if self.bytes_in_flight + size > self.max_bytes:
+            self._reject(endpoint, Rejected(
+                503, "bytes", f"{self.bytes_in_flight} upload bytes already being processed, try again later"))
+        self.active += 1
+        self.bytes_in_flight += size
+        self._update_gauges()
+
+    def release(self, size: int):
+        self.active -= 1
+        self.bytes_in_flight -= size
+        self._update_gauges()
+
+    def reject(self, endpoint: str, rejected: Rejected):
+        # Count a request turned away after admission (e.g. too many files)
+        self.rejected[rejected.reason] = self.rejected.get(rejected.reason, 0) + 1
+        metrics.count(metrics.REJECTIONS, endpoint=endpoint, reason=rejected.reason)
+
+    def _reject(self, endpoint: str, rejected: Rejected):
+        self.reject(endpoint, rejected)
+        raise rejected
+
+    def _update_gauges(self):
+        metrics.gauge(metrics.REQUESTS_IN_FLIGHT, self.active)
+        metrics.gauge(metrics.BYTES_IN_FLIGHT, self.bytes_in_flight)
+
+    def stats(self) -> dict:
+        return {
+            "active_requests": self.active,
+            "max_requests": self.max_requests,
+            "bytes_in_flight": self.bytes_in_flight,
+            "max_bytes_in_flight": self.max_bytes,
+            "max_files_per_request": MAX_FILES_PER_REQUEST,
+            "rejected": dict(self.rejected),
+        }
+
+
+admission = Admission()
+
+
+def error_response(rejected: Rejected) -> JSONResponse:
+    headers = {"Retry-After": str(RETRY_AFTER_SECONDS)} if rejected.status_code == 503 else None
+    return JSONResponse({"detail": rejected.detail}, status_code=rejected.status_code, headers=headers)
+
+
+class AdmissionMiddleware():
+    # ASGI middleware admitting POSTs to the upload endpoints by their
+    # Content-Length, before python-multipart reads the body
+
+    def __init__(self, app, admission: Admission = admission, paths: tuple = UPLOAD_ENDPOINTS):
+        self.app = app
+        self.admission = admission
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope["path"].lstrip("/")
+        headers = dict(scope["headers"])
+        try:
+            size = int(headers[b"content-length"])
+        except (KeyError, ValueError):
+            response = JSONResponse({"detail": "Content-Length is required for uploads"}, status_code=411)
+            await response(scope, receive, send)
+            return
+
+        try:
+            self.admission.acquire(endpoint, size)
+        except Rejected as rejected:
+            await error_response(rejected)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.release(size)
+
+
+def check_file_count(count: int, endpoint: str):
+    if count > MAX_FILES_PER_REQUEST:
+        rejected = Rejected(413, "too_many_files",
+                            f"{count} files in one request, the limit is {MAX_FILES_PER_REQUEST}")
+        admission.reject(endpoint, rejected)
+        raise rejected
+
+
+def spool(upload, path: str) -> int:
+    # Copy an upload to path SPOOL_CHUNK_SIZE bytes at a time (blocking, run
+    # it in a thread); returns its size
+    upload.file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, SPOOL_CHUNK_SIZE)
+        return f.tell()
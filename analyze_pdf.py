@@ -1,10 +1,17 @@
-import pdfplumber
 import re 
+from collections.abc import Iterator, Mapping
+
+import metrics
+from extract_backends import PDFSource, open_document
 
 # Only show errors, not warnings 
 import logging
 logging.getLogger("pdfminer").setLevel(logging.ERROR) 
 
+# Bump whenever a change alters the data produced for the same PDF, so that
+# cached results from older parsers are not reused
+PARSER_VERSION = "2"
+
 # Lists of tests given in English or Spanish. These should be exhaustive, 
 # (will not cause issues if a certain test not given for a particular child)
 EN_TESTS = [
@@ -48,6 +55,16 @@ EN_PROFICIENCY_LEVELS_WITH_WHITESPACE = [
 # Currently not being applied
 SP_PROFICIENCY_LEVELS_WITH_WHITESPACE = []
 
+# Header section of the first page, split into rows of two columns:
+# (line number, first column label, second column label)
+HEADER_ROWS = (
+    (1, "Name", "School"),
+    (2, "Date of Birth", "Teacher"),
+    (3, "Age", "Grade"),
+    (4, "Sex", "ID"),
+    (5, "Date of Testing", "Examiners"),
+)
+
 # Names of observation sections (used in dictionary keys, titles of csv output)
 # same for both english and spanish
 OBS_SECTIONS = (
@@ -74,17 +91,243 @@ SP_OBS_SECTION_HEADERS = (
 EN_OBS_SECTION_HEADER_GENERIC = "Woodcock-Johnson IV Tests"
 SP_OBS_SECTION_HEADER_GENERIC = "Batería IV Woodcock-Muñoz Pruebas"
 
+
+# Page footers look like "2 of 5". Each later page starts with this many
+# repeated header lines, which are skipped along with the footer.
+FOOTER_PATTERN = re.compile(r"^(\d+) of (\d+)\b")
+PAGE_HEADER_LINES = 4
+
+# Start of the long "reason for poor sample" observation, which wraps onto
+# a second line
+POOR_SAMPLE_PREFIXES = (
+    "The results of the WJ IV Tests of",
+    "The results of the Batería IV Woodcock-Muñoz Pruebas",
+)
+
+NON_WORD_PATTERN = re.compile(r"[^\w]+")
+
+
+def _header_patterns(var1: str, var2: str) -> tuple[re.Pattern, re.Pattern]:
+    # Values of the two columns in one header row
+    return (re.compile(fr"{re.escape(var1)}:(.*?){re.escape(var2)}:"),
+            re.compile(fr"{re.escape(var2)}:(.*)"))
+
+
+def _alternation(words: list[str], boundary: str = "") -> re.Pattern | None:
+    # One pattern matching any of the words (longest first), None if empty
+    if not words:
+        return None
+    choices = "|".join(map(re.escape, sorted(words, key=len, reverse=True)))
+    return re.compile(fr"{boundary}({choices}){boundary}")
+
+
+HEADER_PATTERNS = [(i, var1, var2, *_header_patterns(var1, var2))
+                   for i, var1, var2 in HEADER_ROWS]
+
+EN_TEST_PATTERN = _alternation(EN_TESTS)
+SP_TEST_PATTERN = _alternation(SP_TESTS)
+EN_PROFICIENCY_PATTERN = _alternation(EN_PROFICIENCY_LEVELS_WITH_WHITESPACE, r"\b")
+SP_PROFICIENCY_PATTERN = _alternation(SP_PROFICIENCY_LEVELS_WITH_WHITESPACE, r"\b")
+
+
+def score_column(language: str, test: str, metric: str) -> str:
+    # Key used in the report results (and the csv) for one test score
+    return f"{language} - {test.title()} - {metric.strip()}"
+
+
+def obs_section_column(language: str, obs_section: str) -> str:
+    # Prefix shared by every observation key of one section
+    return f"{language} - {obs_section.replace("_", " ").title()}"
+
+
+def obs_column(language: str, obs_section: str, obs_type: str) -> str:
+    # Key used in the report results (and the csv) for one observation
+    return f"{obs_section_column(language, obs_section)}: {obs_type.strip()}"
+
+
+# Columns of the long (tidy) result format: one row per value
+LONG_COLUMNS = ("ID", "Language", "section", "test", "metric", "value", "column")
+
+# Header fields, shared by English and Spanish reports
+HEADER_FIELDS = tuple(field for _, var1, var2 in HEADER_ROWS for field in (var1, var2)) + ("Language",)
+
+# Wide score column -> (test, metric), for both languages
+SCORE_COLUMNS = {
+    score_column(language, test, metric): (test.title(), metric.strip())
+    for language, tests, metrics in (("English", EN_TESTS, EN_METRICS), ("Spanish", SP_TESTS, SP_METRICS))
+    for test in tests
+    for metric in metrics
+}
+
+
+# Every fixed column a report can have, shared by all ReportResults: header
+# fields, then English and Spanish scores. Observation labels are free text
+# and are kept next to it (see ReportResult).
+REPORT_COLUMNS = HEADER_FIELDS + tuple(SCORE_COLUMNS)
+COLUMN_INDEX = {column: i for i, column in enumerate(REPORT_COLUMNS)}
+
+
+class ReportResult(Mapping):
+    # The results of one report, in place of a dict keyed by long column
+    # names: values sit in a list indexed by REPORT_COLUMNS, with a bit per
+    # column that was set (a header value can be None), and observations
+    # as (column, value) pairs. Observation columns, observation answers and
+    # score values are shared between reports (see _share): proficiency
+    # levels and observation answers come from fixed lists, so a batch holds
+    # one copy of each. Reads like the data dict it replaces (same keys,
+    # same order); to_dict() gives that dict.
+
+    __slots__ = ("values", "present", "observations")
+
+    def __init__(self):
+        self.values = [None] * len(REPORT_COLUMNS)
+        self.present = 0
+        self.observations = []
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReportResult":
+        result = cls()
+        for key, value in data.items():
+            result[key] = value
+        result.freeze()
+        return result
+
+    def __setitem__(self, key: str, value):
+        i = COLUMN_INDEX.get(key)
+        if i is not None:
+            self.values[i] = _share(value) if i >= len(HEADER_FIELDS) else value
+            self.present |= 1 << i
+            return
+        # Observations keep the position of their first occurrence, like a dict
+        key, value = _share(key), _share(value)
+        for j, (column, _) in enumerate(self.observations):
+            if column == key:
+                self.observations[j] = (key, value)
+                return
+        self.observations.append((key, value))
+
+    def freeze(self):
+        # Once parsing is done: observations as a tuple, no spare capacity
+        self.observations = tuple(self.observations)
+
+    def __getitem__(self, key: str):
+        i = COLUMN_INDEX.get(key)
+        if i is not None:
+            if self.present >> i & 1:
+                return self.values[i]
+            raise KeyError(key)
+        for column, value in self.observations:
+            if column == key:
+                return value
+        raise KeyError(key)
+
+    def items(self) -> Iterator[tuple[str, object]]:
+        values, present = self.values, self.present
+        for i, column in enumerate(REPORT_COLUMNS):
+            if present >> i & 1:
+                yield column, values[i]
+        yield from self.observations
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key, _ in self.items())
+
+    def __len__(self) -> int:
+        return self.present.bit_count() + len(self.observations)
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __reduce__(self):
+        # Sent back from pool workers; strings are shared again on this side
+        return _restore_result, (self.values, self.present, self.observations)
+
+    def __repr__(self):
+        return f"ReportResult({self.to_dict()!r})"
+
+
+def _restore_result(values: list, present: int, observations: tuple) -> ReportResult:
+    result = ReportResult()
+    header_count = len(HEADER_FIELDS)
+    result.values = values[:header_count] + [_share(value) for value in values[header_count:]]
+    result.present = present
+    result.observations = tuple((_share(column), _share(value)) for column, value in observations)
+    return result
+
+
+# Strings shared by every ReportResult in the process. A plain dict rather
+# than sys.intern: interned strings are never freed on Python 3.12, and
+# header values (names, schools, IDs, dates) are unique to each report, so
+# they are never shared. Once full, new strings are kept as they are, so
+# odd report text can't grow the table without bound.
+SHARED_STRINGS_MAX = 65536
+_shared_strings = {}
+
+
+def _share(value):
+    if type(value) is not str:
+        return value
+    shared = _shared_strings.get(value)
+    if shared is not None:
+        return shared
+    if len(_shared_strings) < SHARED_STRINGS_MAX:
+        _shared_strings[value] = value
+    return value
+
+
+def long_records(data: Mapping) -> list[tuple]:
+    # The results of one report (a ReportResult or its dict) as (ID,
+    # Language, section, test, metric, value, column) rows. section is
+    # "header", "scores" or one of OBS_SECTIONS; column is the key the value
+    # has in the wide layout.
+    student_id = data.get("ID")
+    language = data.get("Language")
+    obs_prefixes = [(f"{obs_section_column(language, obs_section)}: ", obs_section)
+                    for obs_section in OBS_SECTIONS]
+
+    records = []
+    for key, value in data.items():
+        if key in HEADER_FIELDS:
+            records.append((student_id, language, "header", None, key, value, key))
+        elif key in SCORE_COLUMNS:
+            test, metric = SCORE_COLUMNS[key]
+            records.append((student_id, language, "scores", test, metric, value, key))
+        else:
+            for prefix, obs_section in obs_prefixes:
+                if key.startswith(prefix):
+                    records.append((student_id, language, obs_section, None,
+                                    key.removeprefix(prefix), value, key))
+                    break
+    return records
+
+
 class ReportScraper():
     
-    def __init__(self, path: str):
+    def __init__(self, path: PDFSource, lazy: bool = False, backend: str | None = None):
+        # With lazy=True pages are only extracted when a get_* method needs
+        # them: headers and language come from the first page, English scores
+        # stop at the first observation section, and the remaining pages are
+        # only read by get_observations (or Spanish scores, which come last).
+        # backend: text extraction backend (see extract_backends.py),
+        # WJIV_EXTRACT_BACKEND by default.
         
-        self.data = {}
+        self.result = ReportResult()
+        self.text = []
+        self.lazy = lazy
+
+        # Filled in by _index_lines as pages are extracted
+        self.test_lines = {}        # test name -> line #s starting with it
+        self.section_breaks = []    # line #s starting a new obs section
+        self.skip_lines = set()     # footers and repeated page headers
             
-        # Open file 
-        with pdfplumber.open(path) as pdf:
-            self.text = []
-            for page in pdf.pages:
-                self.text.extend(page.extract_text().split("\n"))
+        # Open file (or in-memory PDF)
+        with metrics.timer("open"):
+            self.document = open_document(path, backend)
+            self.pages_loaded = 0
+            self.page_count = self.document.page_count
+        if lazy:
+            self._load_pages(1)
+        else:
+            self._load_pages(self.page_count)
             
         # Find language of report 
         self.language = "English"
@@ -93,14 +336,13 @@ class ReportScraper():
                 self.language = "Spanish"
                 break
         
-        # Find last line of report 
-        self.last_line = len(self.text) - 1
-        
         # Plumb PDF in English or Spanish
         if self.language == "English":
             self.tests = EN_TESTS
             self.metrics = EN_METRICS
             self.proficiency_levels = EN_PROFICIENCY_LEVELS_WITH_WHITESPACE
+            self.test_pattern = EN_TEST_PATTERN
+            self.proficiency_pattern = EN_PROFICIENCY_PATTERN
             self.obs_section_header_generic = EN_OBS_SECTION_HEADER_GENERIC
             
             (self.cognitive_obs_header,  
@@ -112,14 +354,41 @@ class ReportScraper():
             self.tests = SP_TESTS  
             self.metrics = SP_METRICS
             self.proficiency_levels = SP_PROFICIENCY_LEVELS_WITH_WHITESPACE
+            self.test_pattern = SP_TEST_PATTERN
+            self.proficiency_pattern = SP_PROFICIENCY_PATTERN
             self.obs_section_header_generic = SP_OBS_SECTION_HEADER_GENERIC
             
             (self.cognitive_obs_header,  
             self.achievement_obs_header,  
             self.qualitative_obs_header) = SP_OBS_SECTION_HEADERS  
         
-        # Line #s for scores, three sets of observations
-        for i, line in enumerate(self.text):
+        self._index_lines(0)
+
+    @metrics.timed("extract")
+    def _load_pages(self, count: int):
+        # Extract text of the next `count` pages, closing the PDF once every
+        # page has been read
+        first_new_line = len(self.text)
+        pages_before = self.pages_loaded
+        for i in range(self.pages_loaded, min(self.pages_loaded + count, self.page_count)):
+            self.text.extend(self.document.page_text(i).split("\n"))
+            self.pages_loaded += 1
+        metrics.count(metrics.PAGES, self.pages_loaded - pages_before)
+        if self.pages_loaded == self.page_count:
+            self.close()
+        return first_new_line
+
+    def _load_more(self) -> bool:
+        # Extract and index one more page; False once the report is exhausted
+        if self.pages_loaded == self.page_count:
+            return False
+        self._index_lines(self._load_pages(1))
+        return True
+
+    def _index_lines(self, start: int):
+        # Single pass over newly extracted lines, recording where scores,
+        # observation sections, test rows and page breaks are
+        for i, line in enumerate(self.text[start:], start=start):
             if line == "TABLE OF SCORES":
                 self.scores_line = i + 1
             elif line == self.cognitive_obs_header:
@@ -128,44 +397,104 @@ class ReportScraper():
                 self.achievement_obs_first_line = i + 1
             elif line == self.qualitative_obs_header:
                 self.qualitative_obs_first_line = i + 1
-        
-        # Find the first line with observations
-        self.first_obs_line = min(getattr(self, "cognitive_obs_first_line", self.last_line),
-                                  getattr(self, "achievement_obs_first_line", self.last_line),
-                                  getattr(self, "qualitative_obs_first_line", self.last_line),
+
+            if i in self.skip_lines:
+                continue
+
+            # End of page: skip footer and the next page's header lines
+            if FOOTER_PATTERN.match(line):
+                self.skip_lines.update(range(i, i + PAGE_HEADER_LINES + 1))
+            elif line.startswith(self.obs_section_header_generic):
+                self.section_breaks.append(i)
+
+            match = self.test_pattern.match(line)
+            if match:
+                self.test_lines.setdefault(match.group(1), []).append(i)
+
+    def close(self):
+        if self.document is not None:
+            self.document.close()
+            self.document = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def last_line(self) -> int:
+        # Last line of report (extracted so far)
+        return len(self.text) - 1
+
+    @property
+    def first_obs_line(self) -> int:
+        # First line with observations
+        return min(getattr(self, "cognitive_obs_first_line", self.last_line),
+                   getattr(self, "achievement_obs_first_line", self.last_line),
+                   getattr(self, "qualitative_obs_first_line", self.last_line),
         )
-        
+
+    @property
+    def end_of_scores_line(self) -> int:
         # For tests in english, scores are finished at start of observations,
         # For tests in spanish, scores are at end of the report 
         if self.language == "English":
-            self.end_of_scores_line = self.first_obs_line
+            return self.first_obs_line
+        return self.last_line
+
+    def _load_scores(self):
+        # English scores end where the first observation section starts;
+        # Spanish scores run to the end of the report
+        if self.language == "English":
+            while not (hasattr(self, "scores_line") and self._found_obs_section()):
+                if not self._load_more():
+                    break
         else:
-            self.end_of_scores_line = self.last_line 
+            while self._load_more():
+                pass
+
+    def _found_obs_section(self) -> bool:
+        return any(hasattr(self, f"{obs_section}_first_line") for obs_section in OBS_SECTIONS)
 
-                 
     def print_file(self):
         for i, line in enumerate(self.text):
             print(i, line)
+
+    @property
+    def data(self) -> ReportResult:
+        # Results so far, read like a dict (see ReportResult)
+        return self.result
+
+    def to_dict(self) -> dict:
+        return self.result.to_dict()
+
+    def finish(self) -> ReportResult:
+        # Done parsing: close the PDF, drop the extracted text and line
+        # indexes, and hand back the results on their own
+        self.close()
+        self.text = []
+        self.test_lines = {}
+        self.section_breaks = []
+        self.skip_lines = set()
+        self.result.freeze()
+        return self.result
             
     def __str__(self):
-        return "\n".join(f"{k}: {v}" for k, v in self.data.items())
+        return "\n".join(f"{k}: {v}" for k, v in self.result.items())
+
+    def long_records(self) -> list[tuple]:
+        # Results so far in the long format (see long_records)
+        return long_records(self.result)
     
+    @metrics.timed("get_headers")
     def get_headers(self):
         # This section of the PDF is split into lines consisting of two columns
-        header_lines = ([
-            (1, "Name", "School"),
-            (2, "Date of Birth", "Teacher"),
-            (3, "Age", "Grade"),
-            (4, "Sex", "ID"),
-            (5, "Date of Testing", "Examiners"),
-        ])
-
         # Loop through each row of header cols
-        for line in header_lines:
-            i, var1, var2 = line
+        for i, var1, var2, pattern1, pattern2 in HEADER_PATTERNS:
             
             # First column in row 
-            match1 = re.search(fr"{var1}:(.*?){var2}:", self.text[i])
+            match1 = pattern1.search(self.text[i])
             value1 = match1.group(1).strip() if match1 else None
 
             # If age, clean by converting to months (12 * years + months)
@@ -180,137 +509,132 @@ class ReportScraper():
                 value1 = value1.split()[0]
             
             # Second column in row 
-            match2 = re.search(fr"{var2}:(.*)", self.text[i])
+            match2 = pattern2.search(self.text[i])
             value2 = match2.group(1).strip() if match2 else None
             
-            # Save in dictionary 
-            self.data[var1] = value1
-            self.data[var2] = value2
+            # Save in results 
+            self.result[var1] = value1
+            self.result[var2] = value2
             
         # Also include language to be helpful 
-        self.data["Language"] = self.language
+        self.result["Language"] = self.language
         
             
     def set_id(self, id_key: str = "Name"):
-        # Set ID equal to other variable (that is, a key on the data dict)
-        self.data["ID"] = re.split(r'[^\w]+', self.data[id_key])[0]
+        # Set ID equal to other variable (that is, a key on the results)
+        self.result["ID"] = NON_WORD_PATTERN.split(self.result[id_key])[0]
         
         
+    @metrics.timed("get_test_scores")
     def get_test_scores(self):
-        for test in self.tests:   
-            for line in self.text[self.scores_line: self.end_of_scores_line]:
-                if line.startswith(test):
-                    ## Pre-process text  
-                    # remove white space before parenthesis
-                    scores = line.replace(" (", "(")
-                    
-                    # Also replace spaces with underscores for proficiency lvls
-                    pattern = re.compile(r'\b(' + 
-                                         '|'.join(map(re.escape, self.proficiency_levels)) +
-                                         r')\b')
-                    scores = pattern.sub(lambda m: m.group(1).replace(" ", "_"), 
-                                         scores)
-                    
-                    # Remove name of test from scores 
-                    scores = scores.replace(test,"").split() 
-                    
-                    # Save metric/scores
-                    for metric, score in zip(self.metrics, scores):
-                        
-                        ## Post-process text 
-                        # convert underlines back to spaces
-                        score = score.replace("_", " ") 
-                        
-                        # add space back in before parentheses 
-                        score = score.replace("(", " (") 
-                
-                        # Save language, test, metric, and score
-                        self.data[f"{self.language} - {test.title()} - {metric.strip()}"] = score.strip()
-                    
-                    break # since we found the test in sheet, don't keep looking
+        self._load_scores()
+        for test in self.tests:
+            # First row starting with this test inside the table of scores
+            line_nums = [i for i in self.test_lines.get(test, ())
+                         if self.scores_line <= i < self.end_of_scores_line]
+            if not line_nums:
+                continue
+
+            ## Pre-process text  
+            # Remove name of test, and white space before parenthesis
+            scores = self.text[line_nums[0]][len(test):].replace(" (", "(")
+
+            # Also replace spaces with underscores for proficiency lvls
+            if self.proficiency_pattern:
+                scores = self.proficiency_pattern.sub(lambda m: m.group(1).replace(" ", "_"),
+                                                      scores)
+
+            # Save metric/scores
+            for metric, score in zip(self.metrics, scores.split()):
+
+                ## Post-process text 
+                # convert underlines back to spaces
+                score = score.replace("_", " ") 
+
+                # add space back in before parentheses 
+                score = score.replace("(", " (") 
+
+                # Save language, test, metric, and score
+                self.result[score_column(self.language, test, metric)] = score.strip()
+
+    def _next_content_line(self, i: int) -> int | None:
+        # Line # of the next line after i that isn't a footer/page header
+        i += 1
+        while i in self.skip_lines:
+            i += 1
+        return i if i < len(self.text) else None
+
+    def _section_end(self, first_line: int) -> int:
+        # Observation sections run until the next section header
+        for i in self.section_breaks:
+            if i >= first_line:
+                return i
+        return len(self.text)
                 
+    @metrics.timed("get_observations")
     def get_observations(self):
+        # Observations can run to the last page
+        while self._load_more():
+            pass
+
         for obs_section in OBS_SECTIONS:
             
             # Check if observation section exists in report
-            first_line_key = f"{obs_section}_first_line"
-            obs_first_line = getattr(self, first_line_key, None)
-            
-            if obs_first_line:
-                skip_counter = 0
-                # Loop through lines starting at that section of report 
-                lines_to_check = self.text[obs_first_line:]
-                for i, line in enumerate(lines_to_check):
-                    
-                    # If needed, skip to next line  
-                    if skip_counter:
-                        skip_counter -= 1 
-                        continue
-                    
-                    # Check for "reason for poor sample" lines, which are long
-                    # and trip up parsing below
-                    if (line.startswith("The results of the WJ IV Tests of") or
-                        line.startswith("The results of the Batería IV Woodcock-Muñoz Pruebas")
-                        ):
-                            # First, combine line with next line
-                            lines_combined = line + " " + lines_to_check[i+1]
-                            
-                            # Get response value, the info after :
-                            resp = ":".join(lines_combined.split(":")[1:])
-                            
-                            # Reconstruct line with this response 
-                            line = "Poor Sample: " + resp
-                            skip_counter = 1
-                    
-                    # Check if reached next observation section, 
-                    # if so, move to it
-                    if line.startswith(self.obs_section_header_generic):
-                        break 
-                    
-                    # If reached end of page, skip 5 lines (footer/header info)
-                    elif line.startswith(("1 of", "2 of", "3 of")):
-                        skip_counter = 4 # Skip this line + 4 more 
-                        continue # if end of report, this will end the loop
-                    
-                    # If not reached next section nor end of page, check that 
-                    # this line starts an observation, identified via a colon (:)
-                    # If no colon, that means continuation of last line, can skip
-                    elif not ":" in line:
-                        continue
-        
-                    else:
-                        # Otherwise, proceed as normal, getting observation 
-                        line_split = line.split(":")
-                        obs_type = line_split[0]
-                        obs_val = ":".join(line_split[1:])
-                        
-                        # Grab next line (won't cause error, as we know we arent
-                        # at the end of the page)
-                        next_line = lines_to_check[i+1]
-                                
-                        # If the next line is the end of the page 
-                        if ("1 of " in next_line or 
-                            "2 of " in next_line or 
-                            "3 of " in next_line):
-                            # Then check that next line isn't end of report
-                            # Do this by checking for "Page 2 of 2" for example
-                            if next_line != f"{next_line[0]} of {next_line[0]}":
-                                # If not end of report, check 6 lines ahead 
-                                next_line = lines_to_check[i+6]
-                                if not ":" in next_line:
-                                    if not self.obs_section_header_generic in next_line:
-                                    # If next line isn't a new observation, and 
-                                    # is not next section, then add spillover 
-                                    # text to observation value 
-                                        obs_val += " " + next_line
-                                
-                        elif not ":" in next_line:
-                            if not self.obs_section_header_generic in next_line:
-                            # (Same as above), add any spillover text
-                                obs_val += " " + next_line
-                        
-                        # Set observation type equal to observation value 
-                        self.data[f"{self.language} - {obs_section.replace("_", " ").title()}: {obs_type.strip()}"] = obs_val.strip()                          
+            obs_first_line = getattr(self, f"{obs_section}_first_line", None)
+            if not obs_first_line:
+                continue
+
+            i = obs_first_line
+            end = self._section_end(obs_first_line)
+            while i < end:
+                if i in self.skip_lines:
+                    i += 1
+                    continue
+                line = self.text[i]
+                next_i = self._next_content_line(i)
+
+                # Check for "reason for poor sample" lines, which are long
+                # and continue on the next line
+                if line.startswith(POOR_SAMPLE_PREFIXES) and next_i is not None:
+                    # Get response value, the info after :
+                    lines_combined = line + " " + self.text[next_i]
+                    resp = ":".join(lines_combined.split(":")[1:])
+                    line = "Poor Sample: " + resp
+                    next_i = self._next_content_line(next_i)
+
+                # A line starts an observation if it has a colon (:)
+                # If no colon, it is spillover of the last line, skip it
+                if ":" in line:
+                    obs_type, _, obs_val = line.partition(":")
+
+                    # Add spillover text (from the next page if needed) to
+                    # the observation value, unless the next line starts a
+                    # new observation or section
+                    if next_i is not None:
+                        next_line = self.text[next_i]
+                        if (not ":" in next_line and
+                                not self.obs_section_header_generic in next_line):
+                            obs_val += " " + next_line
+
+                    # Set observation type equal to observation value 
+                    self.result[obs_column(self.language, obs_section, obs_type)] = obs_val.strip()
+
+                i = next_i if next_i is not None else end
+
+
+def scrape_report(path: PDFSource, observations: bool = True, backend: str | None = None) -> ReportResult:
+    # Run the full pipeline on one report and return its results (the text
+    # is not kept). Kept at module level so it can be sent to worker
+    # processes. Without observations only the pages holding headers and
+    # scores are extracted.
+    with ReportScraper(path=path, lazy=not observations, backend=backend) as r:
+        r.get_headers()
+        r.set_id(id_key="Name") # "name" in report is actually an id
+        r.get_test_scores()
+        if observations:
+            r.get_observations()
+        return r.finish()
+
 
 if __name__ == "__main__":
     pass
@@ -1,15 +1,65 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import HTMLResponse, StreamingResponse
-import polars as pl
-import tempfile
-import os
+import asyncio
+from contextlib import asynccontextmanager
+import datetime
+from fastapi import Depends, FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 import io
-import pandas as pd
-from datetime import datetime, timedelta
-import regex as re
-from analyze_pdf import ReportScraper
+import os
+import sys
+import tempfile
+from jobs import QueueFull, job_manager
+from archives import TAR_EXTENSIONS, ZIP_EXTENSIONS, archive_extension, expand_archives, is_supported
+from result_store import ResultStore, get_store
+from admission import (RETRY_AFTER_SECONDS, AdmissionMiddleware, Rejected, admission,
+                       check_file_count, error_response, spool)
+import metrics
+
+# The parser (pdfplumber/pdfminer), polars and the SPEAKCAT stack are
+# imported by the endpoints that use them, not here, so a cold worker is
+# serving quickly. With WJIV_WARMUP=1 they are loaded (and a synthetic
+# report parsed, in every pool worker too) before the first request.
+#
+# Several server processes: uvicorn app:app --workers N (or set
+# WEB_CONCURRENCY). Each one has its own parse pool, cache memory,
+# admission limits and job list, so give each WJIV_PARSE_WORKERS of about
+# cores / N, and keep /wjiv_jobs on one process (or sticky sessions): a
+# job's status is only known to the process that took it.
+WARMUP = os.environ.get("WJIV_WARMUP", "0") == "1"
+
+
+async def warm_up():
+    # Parse synthetic reports (see parse_pool.warm_up_pool) and merge and
+    # encode them; the SPEAKCAT modules are only imported
+    from parse_pool import warm_up_pool
+    from typed_output import build_frame, write_frame
+    import speakcat
+
+    with metrics.timer("warm_up"):
+        reports = await asyncio.to_thread(warm_up_pool)
+        await asyncio.to_thread(lambda: write_frame(build_frame(reports, "csv"), "csv"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP:
+        await warm_up()
+    job_manager.start()
+    yield
+    await job_manager.stop()
+    # Only loaded if something was parsed
+    if "parse_pool" in sys.modules:
+        sys.modules["parse_pool"].shutdown_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+# Caps on concurrent uploads and their bytes, see admission.py
+app.add_middleware(AdmissionMiddleware)
+
+
+@app.exception_handler(Rejected)
+async def rejected_handler(request, rejected: Rejected):
+    return error_response(rejected)
 
-app = FastAPI()
 
 HTML_FORM = """
 <!DOCTYPE html>
@@ -29,8 +79,8 @@ HTML_FORM = """
     <h3 class="mb-3">Woodcock Johnson IV Assessment Scraper</h3>
     <form method="post" enctype="multipart/form-data" action="/process_wjiv">
       <div class="mb-3">
-        <label for="wjiv_pdfs" class="form-label">Select WJIV PDF files</label>
-        <input class="form-control" type="file" id="wjiv_pdfs" name="pdfs" multiple accept=".pdf" required />
+        <label for="wjiv_pdfs" class="form-label">Select WJIV PDF files (or a ZIP / tar archive of them)</label>
+        <input class="form-control" type="file" id="wjiv_pdfs" name="pdfs" multiple accept=".pdf,.zip,.tar,.tgz,.tbz2,.txz,.tar.gz,.tar.bz2,.tar.xz" required />
       </div>
       <button type="submit" class="btn btn-primary">Process WJIV</button>
     </form>
@@ -41,8 +91,8 @@ HTML_FORM = """
     <h3 class="mb-3">SPEAKCAT</h3>
     <form method="post" enctype="multipart/form-data" action="/process_speakcat_excel">
       <div class="mb-3">
-        <label for="speakcat_excel" class="form-label">Upload SPEAKCAT Excel file</label>
-        <input class="form-control" type="file" id="speakcat_excel" name="excel" accept=".xlsx,.xls" required />
+        <label for="speakcat_excel" class="form-label">Upload SPEAKCAT Excel file (or a CSV / Parquet export)</label>
+        <input class="form-control" type="file" id="speakcat_excel" name="excel" accept=".xlsx,.xls,.csv,.parquet" required />
       </div>
       <button type="submit" class="btn btn-success">Process SPEAKCAT</button>
     </form>
@@ -57,105 +107,290 @@ async def get_form():
     return HTML_FORM
 
 
+async def spool_uploads(pdfs: list[UploadFile], directory: str, endpoint: str = "process_wjiv") -> list[str]:
+    # Copy every upload to its own file in directory, a chunk at a time, and
+    # parse from there rather than holding all the PDFs in memory. Files are
+    # numbered, so uploads sharing a filename can't collide.
+    # Starlette has already spooled each body to a SpooledTemporaryFile, so
+    # this is a second copy. It is kept because pool workers need a file
+    # they can open by path; Starlette's rolled-over file is anonymous, and
+    # sending the bytes instead would pickle every PDF through a pipe and
+    # hold it in both processes.
+    check_file_count(len(pdfs), endpoint)
+    for upload in pdfs:
+        if not is_supported(upload.filename or ""):
+            extensions = ", ".join((".pdf",) + ZIP_EXTENSIONS + TAR_EXTENSIONS)
+            raise HTTPException(status_code=400, detail=f"Unsupported file {upload.filename!r}, "
+                                                        f"expected one of {extensions}")
+    # Archives keep their extension (see archives.is_archive)
+    paths = [os.path.join(directory, f"{i}{archive_extension(upload.filename or '') or '.pdf'}")
+             for i, upload in enumerate(pdfs)]
+    size = 0
+    for upload, path in zip(pdfs, paths):
+        size += await asyncio.to_thread(spool, upload, path)
+    metrics.count(metrics.FILES, len(paths), endpoint=endpoint)
+    metrics.count(metrics.BYTES_IN, size, endpoint=endpoint)
+    return paths
+
+
+async def remove_after(chunks, directory: tempfile.TemporaryDirectory):
+    # Delete the spooled uploads once a streamed response is over
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        directory.cleanup()
+
+
+async def store_as_parsed(reports, store: ResultStore):
+    # Save each report to the result store as it streams past (reports that
+    # failed to parse are passed on as they are)
+    async for data in reports:
+        if not isinstance(data, Exception):
+            await asyncio.to_thread(store.upsert, [data])
+        yield data
+
+
+async def count_bytes_out(chunks, endpoint: str):
+    async for chunk in chunks:
+        metrics.count(metrics.BYTES_OUT, len(chunk), endpoint=endpoint)
+        yield chunk
+
+
 @app.post("/process_wjiv", response_class=StreamingResponse)
-async def process_wjiv_pdfs(pdfs: list[UploadFile] = File(...)):
-    english_files = []
-    spanish_files = []
-
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        for upload in pdfs:
-            file_path = os.path.join(tmpdirname, upload.filename)
-            contents = await upload.read()
-            with open(file_path, "wb") as f:
-                f.write(contents)
-            r = ReportScraper(path=file_path)
-            r.get_headers()
-            r.set_id(id_key="Name")
-            r.get_test_scores()
-            r.get_observations()
-            if r.language == "English":
-                english_files.append(r.data)
-            else:
-                spanish_files.append(r.data)
-
-        en_df = pl.DataFrame(english_files) if english_files else pl.DataFrame()
-        sp_df = pl.DataFrame(spanish_files) if spanish_files else pl.DataFrame()
-
-        if not en_df.is_empty() and not sp_df.is_empty():
-            df = en_df.join(sp_df, on="ID", how="full", coalesce=True)
-            right_cols = [col for col in df.columns if col.endswith("_right")]
-            df = df.with_columns([
-                pl.coalesce([pl.col(col.replace("_right", "")), pl.col(col)]).alias(col.replace("_right", ""))
-                for col in right_cols
-            ]).drop(right_cols)
-        elif not en_df.is_empty():
-            df = en_df
-        elif not sp_df.is_empty():
-            df = sp_df
-        else:
-            df = pl.DataFrame()
+async def process_wjiv_pdfs(pdfs: list[UploadFile] = File(...), stream: bool = False,
+                            format: str = "csv"):
+    # pdfs: WJIV PDFs, and/or zip or tar archives of them whose members are
+    # parsed one at a time (non-PDF and repeated members are skipped).
+    # format: csv, long (one row per value), or parquet / arrow (Arrow IPC)
+    # for typed columns
+    from parse_pool import iter_reports_async, parse_reports_async
+    from typed_output import FORMATS, build_frame, write_frame
+
+    if format not in FORMATS or (stream and format != "csv"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format {format!r}")
+
+    directory = tempfile.TemporaryDirectory(prefix="wjiv-")
+    if stream:
+        # Fixed columns (see csv_stream), rows written in upload order as
+        # reports are parsed
+        from csv_stream import stream_csv
+
+        try:
+            with metrics.timer("read_uploads", endpoint="process_wjiv"):
+                paths = await spool_uploads(pdfs, directory.name)
+        except BaseException:
+            directory.cleanup()
+            raise
+        # A report that fails to parse is skipped (see stream_csv)
+        reports = iter_reports_async(expand_archives(paths), return_exceptions=True)
+        store = get_store()
+        if store is not None:
+            reports = store_as_parsed(reports, store)
+        chunks = remove_after(stream_csv(reports), directory)
+        if metrics.ENABLED:
+            chunks = count_bytes_out(chunks, "process_wjiv")
+        return StreamingResponse(chunks, media_type="text/csv", headers={
+            "Content-Disposition": 'attachment; filename="wjiv_output.csv"'
+        })
 
-        if not df.is_empty():
-            df = df.select(pl.col("ID"), pl.all().exclude("ID"))
-            df = df.unique().sort("ID")
-            csv_bytes = df.write_csv().encode("utf-8")
-            return StreamingResponse(io.BytesIO(csv_bytes), media_type="text/csv", headers={
-                "Content-Disposition": 'attachment; filename="wjiv_output.csv"'
-            })
+    # Parse on the worker pool; results keep the upload order
+    with directory:
+        with metrics.timer("read_uploads", endpoint="process_wjiv"):
+            paths = await spool_uploads(pdfs, directory.name)
+        with metrics.timer("parse", endpoint="process_wjiv"):
+            reports = await parse_reports_async(expand_archives(paths))
+    # Kept for /results (see result_store.py) when WJIV_STORE_PATH is set
+    store = get_store()
+    if store is not None:
+        with metrics.timer("store", endpoint="process_wjiv"):
+            await asyncio.to_thread(store.upsert, reports)
+    with metrics.timer("merge", endpoint="process_wjiv"):
+        df = build_frame(reports, format)
+
+    if not df.is_empty():
+        with metrics.timer(f"encode_{format}", endpoint="process_wjiv"):
+            output = write_frame(df, format)
+        metrics.count(metrics.BYTES_OUT, len(output), endpoint="process_wjiv")
+        extension, media_type = FORMATS[format]
+        return StreamingResponse(io.BytesIO(output), media_type=media_type, headers={
+            "Content-Disposition": f'attachment; filename="wjiv_output.{extension}"'
+        })
 
     return HTML_FORM
 
 
-def clean_speakcat_fileobj(fileobj) -> io.BytesIO:
-    df = pd.read_excel(fileobj)
-    df_str = df.astype(str)
+@app.post("/wjiv_jobs", status_code=202)
+async def submit_wjiv_job(pdfs: list[UploadFile] = File(...)):
+    # Queue a batch for background parsing and return its job ID right away
+    # The job owns the spooled uploads and deletes them when it is done
+    directory = tempfile.TemporaryDirectory(prefix="wjiv-job-")
+    try:
+        paths = await spool_uploads(pdfs, directory.name, endpoint="wjiv_jobs")
+        job = job_manager.submit([upload.filename for upload in pdfs], paths, directory)
+    except QueueFull as e:
+        directory.cleanup()
+        admission.reject("wjiv_jobs", Rejected(503, "job_queue", str(e)))
+        raise HTTPException(status_code=503, detail=f"Too many WJIV jobs queued ({e}), try again later",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except BaseException:
+        directory.cleanup()
+        raise
+    return {
+        "job_id": job.id,
+        "status_url": f"/wjiv_jobs/{job.id}",
+        "csv_url": f"/wjiv_jobs/{job.id}/csv",
+    }
+
+
+@app.get("/wjiv_jobs/{job_id}")
+async def wjiv_job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.status()
+
+
+@app.get("/wjiv_jobs/{job_id}/csv", response_class=StreamingResponse)
+async def wjiv_job_csv(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job.state != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    return StreamingResponse(io.BytesIO(job.csv), media_type="text/csv", headers={
+        "Content-Disposition": f'attachment; filename="wjiv_output_{job.id}.csv"'
+    })
+
+
+def require_store() -> ResultStore:
+    store = get_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="The result store is off, set WJIV_STORE_PATH to use it")
+    return store
+
+
+def result_filters(id: list[str] | None = Query(None), school: str | None = None,
+                   date_from: datetime.date | None = None, date_to: datetime.date | None = None,
+                   test: str | None = None, language: str | None = None) -> dict:
+    # Filters shared by the /results endpoints: student IDs (repeatable),
+    # school (ignoring case), dates of testing (inclusive), a test the
+    # report has scores for, and English/Spanish
+    return {"ids": id, "school": school, "date_from": date_from, "date_to": date_to,
+            "test": test, "language": language}
+
+
+@app.get("/results")
+async def list_results(filters: dict = Depends(result_filters), limit: int = 1000):
+    # Stored reports matching the filters, from the result store
+    store = require_store()
+    reports = await asyncio.to_thread(store.summaries, limit=limit, **filters)
+    return {"count": len(reports), "reports": reports}
+
+
+@app.get("/results/export", response_class=StreamingResponse)
+async def export_results(filters: dict = Depends(result_filters), format: str = "csv"):
+    # The same export as /process_wjiv, built from stored results instead
+    # of PDFs
+    from typed_output import FORMATS, build_frame, write_frame
 
-    # Filter rows NOT containing "test" in any email/ID column 
-    cols_to_check = [col for col in df.columns if 
-                        ("email" in col.lower()) or 
-                        ("ID" in col) or
-                        ("identifier" in col)
-                    ]
-    if cols_to_check:
-        mask = df[cols_to_check].apply(lambda col: col.astype(str).str.lower().str.contains("test", na=False)).any(axis=1)
-        df = df[~mask]
-      
-    df['submit_timestamp'] = pd.to_datetime(df['submit_timestamp'])
-    df.sort_values(by='submit_timestamp', ascending=False, inplace=True)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {format!r}")
+    store = require_store()
+    with metrics.timer("query", endpoint="results_export"):
+        reports = await asyncio.to_thread(store.reports, **filters)
+    if not reports:
+        raise HTTPException(status_code=404, detail="No stored results match")
+    with metrics.timer(f"encode_{format}", endpoint="results_export"):
+        output = await asyncio.to_thread(lambda: write_frame(build_frame(reports, format), format))
+    metrics.count(metrics.BYTES_OUT, len(output), endpoint="results_export")
+    extension, media_type = FORMATS[format]
+    return StreamingResponse(io.BytesIO(output), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="wjiv_results.{extension}"'
+    })
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        now = datetime.now()
-        week_prior = now - timedelta(weeks=1)
-        df_last_week = df[df['submit_timestamp'] > week_prior]
 
-        scores_mean = pd.to_numeric(df_last_week['overall_total_score'], errors='coerce').mean()
-        avg_score_row = {'Organization': "Average Score", 'overall_total_score': scores_mean}
-        study_df = pd.concat([df_last_week, pd.DataFrame([avg_score_row])], ignore_index=True)
+@app.post("/debug/profile")
+async def debug_profile(pdf: UploadFile = File(...), sort: str = "cumulative", limit: int = 25,
+                        format: str = "json"):
+    # Profile parsing one WJIV report (see report_profile.py): stage wall
+    # times, pages and lines scanned, call-count hot spots of the score and
+    # observation stages, and the cProfile output. format=prof returns the
+    # profile itself, for snakeviz or pstats. Off unless WJIV_PROFILING=1.
+    from report_profile import PROFILING, SORT_KEYS, dump_profile, profile_report
 
-        df_last_week.to_excel(writer, sheet_name='Last Week', index=False)
+    if not PROFILING:
+        raise HTTPException(status_code=404, detail="Profiling is off, set WJIV_PROFILING=1 to use it")
+    if format not in ("json", "prof") or sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {format!r} or sort {sort!r}")
 
-        for study_name in df["StudyID"].unique().tolist():
-            study_df = df[df["StudyID"] == study_name]
-            scores_mean = pd.to_numeric(study_df['overall_total_score'], errors='coerce').mean()
-            avg_score_row = {'Organization': "Average Score", 'overall_total_score': scores_mean}
-            study_df = pd.concat([study_df, pd.DataFrame([avg_score_row])], ignore_index=True)
+    with tempfile.TemporaryDirectory(prefix="wjiv-profile-") as directory:
+        path = os.path.join(directory, "report.pdf")
+        await asyncio.to_thread(spool, pdf, path)
+        try:
+            summary, stats = await asyncio.to_thread(profile_report, path, sort=sort, limit=limit)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Could not parse report: {type(e).__name__}: {e}")
 
-            sheet_name = re.sub(r'[\[\]\:\*\?\/\\]', '', study_name)[:31]
-            study_df.to_excel(writer, sheet_name=sheet_name, index=False)
+    if format == "prof":
+        return Response(dump_profile(stats), media_type="application/octet-stream", headers={
+            "Content-Disposition": 'attachment; filename="wjiv_profile.prof"'
+        })
+    return {"filename": pdf.filename, **summary}
 
-    output.seek(0)
-    return output
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format; empty unless WJIV_METRICS=1
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admission_stats")
+async def admission_stats():
+    # Uploads being processed against their limits, requests turned away
+    # (by reason) and batch jobs waiting to run
+    return {**admission.stats(), "queued_jobs": job_manager.queue_depth()}
+
+
+@app.get("/cache_stats")
+async def cache_stats():
+    # Hit/miss counters for the WJIV parse cache
+    from report_cache import get_cache
+
+    cache = get_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
 
 
 @app.post("/process_speakcat_excel", response_class=StreamingResponse)
-async def process_speakcat_excel(excel: UploadFile = File(...)):
-    contents = await excel.read()
-    fileobj = io.BytesIO(contents)
-    output = clean_speakcat_fileobj(fileobj)
-
-    return StreamingResponse(
-        output,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': 'attachment; filename="SPEAKCAT_Results_Cleaned.xlsx"'}
-    )
+async def process_speakcat_excel(excel: UploadFile = File(...), stream: bool = False):
+    # excel: the SPEAKCAT export as .xlsx/.xls, or as .csv / .parquet to skip
+    # the Excel parse. With stream, sheets are written row by row in
+    # constant memory and the workbook is sent as it is zipped.
+    from speakcat import prepare_speakcat, speakcat_workbook, stream_speakcat
+
+    filename = excel.filename or ""
+    headers = {'Content-Disposition': 'attachment; filename="SPEAKCAT_Results_Cleaned.xlsx"'}
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    # Spooled to disk and read from there by polars
+    with tempfile.TemporaryDirectory(prefix="speakcat-") as directory:
+        path = os.path.join(directory, "upload" + os.path.splitext(filename)[1].lower())
+        size = await asyncio.to_thread(spool, excel, path)
+        metrics.count(metrics.FILES, endpoint="process_speakcat_excel")
+        metrics.count(metrics.BYTES_IN, size, endpoint="process_speakcat_excel")
+
+        # Reading, cleaning and writing run on a thread, off the event loop
+        if stream:
+            cleaned, averages = await asyncio.to_thread(prepare_speakcat, path, filename)
+        else:
+            with metrics.timer("total", endpoint="process_speakcat_excel"):
+                output = await asyncio.to_thread(speakcat_workbook, path, filename)
+
+    if stream:
+        chunks = stream_speakcat(cleaned, averages)
+        if metrics.ENABLED:
+            chunks = count_bytes_out(chunks, "process_speakcat_excel")
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+    metrics.count(metrics.BYTES_OUT, output.getbuffer().nbytes, endpoint="process_speakcat_excel")
+    return StreamingResponse(output, media_type=media_type, headers=headers)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import tarfile
+import zipfile
+import zlib
+from collections.abc import Iterable, Iterator
+
+# Extensions read as archives of WJIV reports, anything else is a PDF
+ZIP_EXTENSIONS = (".zip",)
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Members bigger than this are skipped, so a single bad (or malicious)
+# member can't exhaust memory when it is decompressed
+MAX_MEMBER_BYTES = int(os.environ.get("WJIV_MAX_ARCHIVE_MEMBER_BYTES", 64 * 1024 * 1024))
+
+
+def archive_extension(filename: str) -> str | None:
+    name = filename.lower()
+    for extension in ZIP_EXTENSIONS + TAR_EXTENSIONS:
+        if name.endswith(extension):
+            return extension
+    return None
+
+
+def is_archive(filename: str) -> bool:
+    return archive_extension(filename) is not None
+
+
+def is_supported(filename: str) -> bool:
+    # A PDF (or a file without an extension, read as one) or an archive;
+    # e.g. a plain .gz that isn't a tar archive is not
+    extension = os.path.splitext(filename.lower())[1]
+    return extension in ("", ".pdf") or is_archive(filename)
+
+
+class ArchiveReports():
+    # The WJIV reports in a zip or tar archive, as PDF bytes, read one
+    # member at a time (nothing is extracted to disk). Members that aren't
+    # PDFs, or repeat one already seen (by content, shared across archives
+    # through `seen`), are skipped and listed in self.skipped. An archive
+    # that turns out to be corrupt ends early, the rest of it listed as
+    # skipped, rather than failing the batch it is in.
+    #
+    #   for contents in ArchiveReports("reports.zip"):
+    #       ReportScraper(contents)
+
+    def __init__(self, path: str, seen: set | None = None):
+        self.path = path
+        self.seen = seen if seen is not None else set()
+        self.names = []    # members yielded, in order
+        self.skipped = []  # (member, reason)
+
+    def __iter__(self) -> Iterator[bytes]:
+        if archive_extension(self.path) in ZIP_EXTENSIONS:
+            members = self._zip_members()
+        else:
+            members = self._tar_members()
+        try:
+            yield from self._reports(members)
+        except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError) as e:
+            self.skipped.append(("(rest of archive)", f"unreadable archive: {type(e).__name__}: {e}"))
+
+    def _reports(self, members: Iterator[tuple[str, bytes | None]]) -> Iterator[bytes]:
+        for name, contents in members:
+            if contents is None:
+                continue
+            if b"%PDF" not in contents[:1024]:
+                self.skipped.append((name, "not a PDF"))
+                continue
+            digest = hashlib.sha256(contents).digest()
+            if digest in self.seen:
+                self.skipped.append((name, "duplicate"))
+                continue
+            self.seen.add(digest)
+            self.names.append(name)
+            yield contents
+
+    def _wanted(self, name: str, size: int) -> bool:
+        base = os.path.basename(name)
+        # macOS adds "__MACOSX/._report.pdf" resource forks to zips
+        if not base.lower().endswith(".pdf") or base.startswith("._") or name.startswith("__MACOSX/"):
+            self.skipped.append((name, "not a PDF"))
+            return False
+        if size > MAX_MEMBER_BYTES:
+            self.skipped.append((name, f"over {MAX_MEMBER_BYTES} bytes"))
+            return False
+        return True
+
+    def _zip_members(self) -> Iterator[tuple[str, bytes | None]]:
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not self._wanted(info.filename, info.file_size):
+                    continue
+                with archive.open(info) as member:
+                    # file_size comes from the archive itself, don't trust it
+                    contents = member.read(MAX_MEMBER_BYTES + 1)
+                if len(contents) > MAX_MEMBER_BYTES:
+                    self.skipped.append((info.filename, f"over {MAX_MEMBER_BYTES} bytes"))
+                    contents = None
+                yield info.filename, contents
+
+    def _tar_members(self) -> Iterator[tuple[str, bytes | None]]:
+        # Stream mode: decompressed front to back, no seeking
+        with tarfile.open(self.path, mode="r|*") as archive:
+            for info in archive:
+                if not info.isfile() or not self._wanted(info.name, info.size):
+                    continue
+                yield info.name, archive.extractfile(info).read()
+
+
+def expand_archives(paths: Iterable[str], archives: list | None = None) -> Iterator[str | bytes]:
+    # Report sources for parse_pool: each PDF path as it is, each archive as
+    # its member PDFs (bytes). Archives read are appended to `archives` so
+    # the caller can report what was skipped.
+    seen = set()
+    for path in paths:
+        if not is_archive(path):
+            yield path
+            continue
+        reports = ArchiveReports(path, seen)
+        if archives is not None:
+            archives.append(reports)
+        yield from reports
@@ -0,0 +1,232 @@
+# Parser benchmarks on synthetic reports (see synthetic_reports.py).
+#
+#   python benchmark.py --sizes 1,10,50 --pages 3
+#   python benchmark.py --compare bench_results/<older run>.json
+#
+# Times each ReportScraper stage per report, then the end-to-end
+# /process_wjiv handler and generate_csv.py across batch sizes, and how long
+# a fresh server process takes to start and answer its first WJIV request
+# (with and without WJIV_WARMUP). Results are
+# saved as JSON under bench_results/, named by time and git commit, so runs
+# from different commits can be compared.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Measure parsing, not the parse cache (pass --cache to include it)
+if "--cache" not in sys.argv:
+    os.environ["WJIV_CACHE_ENABLED"] = "0"
+
+from starlette.datastructures import UploadFile
+
+from analyze_pdf import ReportScraper
+import synthetic_reports
+
+RESULTS_DIR = "bench_results"
+
+
+def timed(fn, *args, **kwargs) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "runs": len(samples),
+    }
+
+
+def bench_stages(reports: list[tuple[str, bytes]], repeat: int) -> dict:
+    # Per-report time of each ReportScraper stage
+    stages = {"open_extract": [], "get_headers": [], "get_test_scores": [], "get_observations": []}
+    for _ in range(repeat):
+        for _, contents in reports:
+            elapsed, r = timed(ReportScraper, contents)
+            stages["open_extract"].append(elapsed)
+            stages["get_headers"].append(timed(r.get_headers)[0])
+            r.set_id(id_key="Name")
+            stages["get_test_scores"].append(timed(r.get_test_scores)[0])
+            stages["get_observations"].append(timed(r.get_observations)[0])
+    return {stage: summarize(samples) for stage, samples in stages.items()}
+
+
+async def _post_wjiv(reports: list[tuple[str, bytes]]) -> int:
+    from app import process_wjiv_pdfs
+
+    uploads = [UploadFile(io.BytesIO(contents), filename=filename) for filename, contents in reports]
+    response = await process_wjiv_pdfs(uploads)
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    return size
+
+
+def bench_endpoint(reports: list[tuple[str, bytes]], repeat: int) -> dict:
+    # Calls the handler directly with in-memory uploads (no HTTP layer)
+    samples = [timed(asyncio.run, _post_wjiv(reports))[0] for _ in range(repeat)]
+    return summarize(samples)
+
+
+def bench_generate_csv(reports: list[tuple[str, bytes]], repeat: int) -> dict:
+    import generate_csv
+
+    samples = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        os.makedirs(os.path.join(tmpdirname, "data"))
+        for filename, contents in reports:
+            with open(os.path.join(tmpdirname, "data", filename), "wb") as f:
+                f.write(contents)
+        os.chdir(tmpdirname)
+        try:
+            for _ in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    samples.append(timed(generate_csv.main, [])[0])
+        finally:
+            os.chdir(cwd)
+    return summarize(samples)
+
+
+# Run in a fresh interpreter by bench_startup: imports the app first thing,
+# starts it, then times two single-report /process_wjiv requests
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+import asyncio, io, json, sys
+from starlette.datastructures import UploadFile
+
+async def main():
+    with open(sys.argv[1], "rb") as f:
+        contents = f.read()
+    timings = {"import_s": imported - start}
+    started = time.perf_counter()
+    async with app.lifespan(app.app):
+        timings["startup_s"] = time.perf_counter() - started
+        for name in ("first_request_s", "second_request_s"):
+            started = time.perf_counter()
+            response = await app.process_wjiv_pdfs([UploadFile(io.BytesIO(contents), filename="report.pdf")])
+            async for chunk in response.body_iterator:
+                pass
+            timings[name] = time.perf_counter() - started
+    print(json.dumps(timings))
+
+asyncio.run(main())
+"""
+
+
+def bench_startup(pages: int, repeat: int) -> dict:
+    # Cold start of a server process: time to import app.py, run its
+    # startup (lifespan) and serve the first and second request
+    results = {}
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as report:
+        report.write(synthetic_reports.report_pdf("S0", pages=pages))
+        report.flush()
+        for mode, warmup in (("cold", "0"), ("warm_up", "1")):
+            env = {**os.environ, "WJIV_WARMUP": warmup}
+            samples = {}
+            for _ in range(repeat):
+                output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, report.name], env=env,
+                                        capture_output=True, text=True, check=True).stdout
+                for name, seconds in json.loads(output.splitlines()[-1]).items():
+                    samples.setdefault(name, []).append(seconds)
+            results[mode] = {name: summarize(values) for name, values in samples.items()}
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes: list[int], pages: int, repeat: int) -> dict:
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "pages": pages,
+        "stages": bench_stages(synthetic_reports.corpus(6, pages), repeat),
+        "startup": bench_startup(pages, repeat),
+        "batches": {},
+    }
+    for size in sizes:
+        reports = synthetic_reports.corpus(size, pages)
+        results["batches"][str(size)] = {
+            "process_wjiv": bench_endpoint(reports, repeat),
+            "generate_csv": bench_generate_csv(reports, repeat),
+        }
+    return results
+
+
+def flatten(results: dict) -> dict:
+    # "stages.get_headers" / "startup.cold.first_request_s" /
+    # "batches.10.process_wjiv" -> median seconds. Older result files have
+    # no startup timings.
+    flat = {f"stages.{stage}": timing["median_s"] for stage, timing in results["stages"].items()}
+    for mode, timings in results.get("startup", {}).items():
+        for name, timing in timings.items():
+            flat[f"startup.{mode}.{name}"] = timing["median_s"]
+    for size, paths in results["batches"].items():
+        for path, timing in paths.items():
+            flat[f"batches.{size}.{path}"] = timing["median_s"]
+    return flat
+
+
+def print_results(results: dict, baseline: dict | None = None):
+    current = flatten(results)
+    previous = flatten(baseline) if baseline else {}
+    for name, seconds in current.items():
+        line = f"{name:40s} {seconds * 1000:10.2f} ms"
+        if name in previous and previous[name]:
+            line += f"   {seconds / previous[name]:6.2f}x vs {baseline['commit']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WJIV parser on synthetic reports")
+    parser.add_argument("--sizes", default="1,10,50", help="comma separated batch sizes")
+    parser.add_argument("--pages", type=int, default=3, help="pages per synthetic report")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--cache", action="store_true", help="leave the parse cache enabled")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(",")], args.pages, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{results['timestamp'].replace(':', '')}-{results['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Checks the text extraction backends (see extract_backends.py) against
+# each other on a reference corpus: every report is scraped with each
+# backend and its results compared, key order included, with pdfplumber's.
+# Also times each backend, so WJIV_EXTRACT_BACKEND can be set to the
+# fastest one that matches on a deployment's own reports.
+#
+#   python compare_backends.py data/
+#   python compare_backends.py --synthetic 50 --pages 3
+#
+# Exits with status 1 if any backend gave different results.
+
+import argparse
+import os
+import sys
+import time
+
+from analyze_pdf import scrape_report
+from extract_backends import BACKENDS, available_backends
+import synthetic_reports
+
+REFERENCE = "pdfplumber"
+
+
+def load_corpus(paths: list[str]) -> list[tuple[str, bytes]]:
+    # (name, PDF bytes) of every PDF in the given files and directories
+    reports = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(entry.path for entry in os.scandir(path)
+                           if entry.is_file() and entry.name.lower().endswith(".pdf"))
+        else:
+            files = [path]
+        for file in files:
+            with open(file, "rb") as f:
+                reports.append((file, f.read()))
+    return reports
+
+
+def scrape_all(reports: list[tuple[str, bytes]], backend: str) -> tuple[float, list]:
+    # Seconds taken and each report's results as a list of (key, value)
+    # pairs, or the exception it raised
+    results = []
+    start = time.perf_counter()
+    for _, contents in reports:
+        try:
+            results.append(list(scrape_report(contents, backend=backend).items()))
+        except Exception as e:
+            results.append(e)
+    return time.perf_counter() - start, results
+
+
+def differences(expected, actual) -> list[str]:
+    # What changed between two reports' results, for printing
+    if isinstance(expected, Exception) or isinstance(actual, Exception):
+        return [f"{type(expected).__name__ if isinstance(expected, Exception) else 'results'} != "
+                f"{type(actual).__name__ if isinstance(actual, Exception) else 'results'}"]
+    expected_dict, actual_dict = dict(expected), dict(actual)
+    lines = []
+    for key in dict.fromkeys([key for key, _ in expected] + [key for key, _ in actual]):
+        if expected_dict.get(key, "<missing>") != actual_dict.get(key, "<missing>"):
+            lines.append(f"{key}: {expected_dict.get(key, '<missing>')!r} != "
+                         f"{actual_dict.get(key, '<missing>')!r}")
+    if not lines:
+        lines.append("same values, different key order")
+    return lines
+
+
+def compare(reports: list[tuple[str, bytes]], backends: list[str], show: int) -> bool:
+    # Print a line per backend (and the first `show` differing reports);
+    # True if every available backend matched the reference
+    reference_seconds, reference = scrape_all(reports, REFERENCE)
+    print(f"{len(reports)} reports")
+    print(f"{REFERENCE:12s} {'reference':>22s} {reference_seconds:9.2f} s")
+
+    all_match = True
+    available = available_backends()
+    for backend in backends:
+        if backend == REFERENCE:
+            continue
+        if backend not in available:
+            print(f"{backend:12s} {'not available':>22s}")
+            continue
+        seconds, results = scrape_all(reports, backend)
+        differing = [i for i, (expected, actual) in enumerate(zip(reference, results)) if expected != actual]
+        all_match = all_match and not differing
+        identical = f"{len(reports) - len(differing)}/{len(reports)} identical"
+        print(f"{backend:12s} {identical:>22s} {seconds:9.2f} s  {reference_seconds / seconds:5.2f}x")
+        for i in differing[:show]:
+            print(f"  {reports[i][0]}")
+            for line in differences(reference[i], results[i])[:10]:
+                print(f"    {line}")
+    return all_match
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every text extraction backend gives the same "
+                                                 "WJIV results as pdfplumber, and time them")
+    parser.add_argument("paths", nargs="*", help="PDFs, or directories of them")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="add this many synthetic reports (used alone when no paths are given)")
+    parser.add_argument("--pages", type=int, default=3, help="pages per synthetic report")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated backends to check")
+    parser.add_argument("--show", type=int, default=5, help="differing reports to print per backend")
+    args = parser.parse_args()
+
+    reports = load_corpus(args.paths)
+    if args.synthetic or not reports:
+        reports += synthetic_reports.corpus(args.synthetic or 20, args.pages)
+
+    if not compare(reports, args.backends.split(","), args.show):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import csv
+import io
+import logging
+import os
+from collections.abc import Mapping
+
+from analyze_pdf import (
+    EN_TESTS,
+    SP_TESTS,
+    EN_METRICS,
+    SP_METRICS,
+    HEADER_ROWS,
+    OBS_SECTIONS,
+    score_column,
+    obs_section_column,
+)
+
+LANGUAGES = (
+    ("English", EN_TESTS, EN_METRICS),
+    ("Spanish", SP_TESTS, SP_METRICS),
+)
+
+# Separator between observations packed into one streamed csv cell
+OBS_SEPARATOR = " | "
+
+# Reports held back waiting for their other-language partner. A report
+# still unpaired when this many newer ones are waiting is written on its
+# own, so English and Spanish reports further apart than this in the
+# upload come out as two rows. 0 writes every report straight away.
+MERGE_WINDOW = int(os.environ.get("WJIV_STREAM_MERGE_WINDOW", "32"))
+
+logger = logging.getLogger(__name__)
+
+
+def build_schema() -> list[str]:
+    # Every column a streamed csv can contain, in output order. Header and
+    # score columns come straight from the constants in analyze_pdf.
+    # Observation labels are free text, so each observation section gets a
+    # single column holding "Type: value" pairs.
+    columns = ["ID"]
+    for _, var1, var2 in HEADER_ROWS:
+        columns.extend(col for col in (var1, var2) if col != "ID")
+    columns.append("Language")
+
+    for language, tests, metrics in LANGUAGES:
+        for test in tests:
+            columns.extend(score_column(language, test, metric) for metric in metrics)
+    columns.extend(OBS_SECTION_COLUMNS)
+    return columns
+
+
+# Observation section columns, used to fold per-observation keys into them
+OBS_SECTION_COLUMNS = [obs_section_column(language, obs_section)
+                       for language, _, _ in LANGUAGES
+                       for obs_section in OBS_SECTIONS]
+
+SCHEMA = build_schema()
+SCHEMA_COLUMNS = frozenset(SCHEMA)
+
+
+def to_row(data: Mapping) -> dict:
+    # Map one report's results onto the fixed schema
+    row = {}
+    for key, value in data.items():
+        if key in SCHEMA_COLUMNS:
+            row[key] = value
+            continue
+        for section in OBS_SECTION_COLUMNS:
+            if key.startswith(f"{section}: "):
+                obs = f"{key.removeprefix(f'{section}: ')}: {value}"
+                row[section] = f"{row[section]}{OBS_SEPARATOR}{obs}" if section in row else obs
+                break
+    return row
+
+
+def merge_rows(english: dict, spanish: dict) -> dict:
+    # Same result as the full join + coalesce on ID: English values win,
+    # Spanish ones fill the gaps
+    row = dict(spanish)
+    row.update((key, value) for key, value in english.items() if value is not None)
+    return row
+
+
+class RowMerger():
+    # Pairs up English and Spanish reports for the same ID as they arrive.
+    # A row is released as soon as both languages for its ID have been seen,
+    # or once `window` newer reports are waiting (see MERGE_WINDOW); the
+    # rest are released by flush().
+
+    def __init__(self, window: int = MERGE_WINDOW):
+        self.window = window
+        self.pending = {}  # ID -> row, oldest first
+
+    def add(self, data: Mapping) -> list[dict]:
+        row = to_row(data)
+        student_id = row.get("ID")
+        language = row.get("Language")
+
+        other = self.pending.pop(student_id, None)
+        if other is not None and other.get("Language") != language:
+            if language == "English":
+                return [merge_rows(row, other)]
+            return [merge_rows(other, row)]
+
+        # Repeat of the same language: the older one is written now
+        rows = [other] if other is not None else []
+        self.pending[student_id] = row
+        while len(self.pending) > self.window:
+            rows.append(self.pending.pop(next(iter(self.pending))))
+        return rows
+
+    def flush(self) -> list[dict]:
+        rows = list(self.pending.values())
+        self.pending.clear()
+        return rows
+
+
+def encode_rows(rows: list[dict], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SCHEMA, lineterminator="\n")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def stream_csv(reports):
+    # Async generator of csv chunks: the header line straight away, then each
+    # row as soon as its report (and any language partner) has been parsed.
+    # reports may yield exceptions (iter_reports_async with
+    # return_exceptions); the response has already started, so a report that
+    # failed to parse is logged and left out rather than cutting it short.
+    yield encode_rows([], header=True)
+    merger = RowMerger()
+    i = 0
+    async for data in reports:
+        i += 1
+        if isinstance(data, Exception):
+            logger.warning("Skipped report %d of the streamed batch: %s: %s", i, type(data).__name__, data)
+            continue
+        rows = merger.add(data)
+        if rows:
+            yield encode_rows(rows)
+    rows = merger.flush()
+    if rows:
+        yield encode_rows(rows)
@@ -0,0 +1,230 @@
+import io
+import itertools
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import BinaryIO
+
+import pdfplumber
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LTChar, LTContainer
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+# Text extraction backends for ReportScraper. Each one opens a report and
+# gives the text of a page as lines in the same form pdfplumber's
+# extract_text() does; compare_backends.py checks that they produce the
+# same data on a corpus before one is picked with WJIV_EXTRACT_BACKEND.
+EXTRACT_BACKEND = os.environ.get("WJIV_EXTRACT_BACKEND", "pdfplumber")
+
+# A report can be given as a file path, the raw PDF bytes, or a binary
+# file-like object
+PDFSource = str | os.PathLike | bytes | bytearray | memoryview | BinaryIO
+
+# pdfplumber's defaults: characters closer than this (in points) are one
+# word, and words whose tops are this close are one line
+X_TOLERANCE = 3
+Y_TOLERANCE = 3
+
+# Expanded to their letters, as pdfplumber does
+LIGATURES = {"ﬀ": "ff", "ﬃ": "ffi", "ﬄ": "ffl", "ﬁ": "fi", "ﬂ": "fl", "ﬆ": "st", "ﬅ": "st"}
+
+PDFTOTEXT = os.environ.get("WJIV_PDFTOTEXT", "pdftotext")
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def open_pdf(source: PDFSource) -> pdfplumber.PDF:
+    # pdfplumber takes paths and seekable streams; wrap in-memory buffers
+    # (BytesIO shares the buffer of a bytes object rather than copying it)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return pdfplumber.open(source)
+
+
+class PdfplumberDocument():
+    # The reference backend: pdfplumber's extract_text(), which builds a
+    # dict of attributes for every character before grouping them
+
+    def __init__(self, source: PDFSource):
+        self.pdf = open_pdf(source)
+        self.page_count = len(self.pdf.pages)
+
+    def page_text(self, i: int) -> str:
+        return self.pdf.pages[i].extract_text()
+
+    def close(self):
+        self.pdf.close()
+
+
+class PdfminerDocument():
+    # pdfminer directly, with layout analysis off (laparams=None, as
+    # pdfplumber runs it too). Characters are grouped into words and lines
+    # with pdfplumber's rules, on plain tuples instead of attribute dicts.
+
+    def __init__(self, source: PDFSource):
+        if isinstance(source, (str, os.PathLike)):
+            self.file = open(source, "rb")
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self.file = io.BytesIO(source)
+        else:
+            self.file = None
+        document = PDFDocument(PDFParser(self.file or source))
+        self.pages = list(PDFPage.create_pages(document))
+        self.page_count = len(self.pages)
+        self.device = PDFPageAggregator(PDFResourceManager(), laparams=None)
+        self.interpreter = PDFPageInterpreter(self.device.rsrcmgr, self.device)
+
+    def page_text(self, i: int) -> str:
+        self.interpreter.process_page(self.pages[i])
+        layout = self.device.get_result()
+        chars = []
+        for char in _iter_chars(layout):
+            # (text, x0, x1, top, bottom, upright), top measured from the
+            # top of the page like pdfplumber
+            chars.append((char.get_text(), char.x0, char.x1, layout.height - char.y1,
+                          layout.height - char.y0, char.upright))
+        return chars_to_text(chars)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def _iter_chars(container: LTContainer):
+    for item in container:
+        if isinstance(item, LTChar):
+            yield item
+        elif isinstance(item, LTContainer):
+            yield from _iter_chars(item)
+
+
+def _cluster_ids(values, tolerance: float) -> dict:
+    # Value -> cluster number, values within tolerance of the previous one
+    # (in sorted order) sharing a cluster
+    ids = {}
+    cluster, last = -1, None
+    for value in sorted(set(values)):
+        if last is None or value > last + tolerance:
+            cluster += 1
+        ids[value] = cluster
+        last = value
+    return ids
+
+
+def _words(line: list[tuple], upright: bool) -> list[tuple[str, float]]:
+    # (text, top) of each word in one line of characters, already in
+    # reading order. A word ends at whitespace, when the next character
+    # starts before the last one, or is more than the tolerance past it.
+    words = []
+    word = []
+    for char in line:
+        text, x0, x1, top, bottom, _ = char
+        if text.isspace():
+            if word:
+                words.append(word)
+            word = []
+            continue
+        if text == "":
+            # pdfplumber makes an empty character a word of its own
+            if word:
+                words.append(word)
+            words.append([char])
+            word = []
+            continue
+        if word:
+            prev = word[-1]
+            if upright:
+                new_word = (x0 < prev[1] or x0 > prev[2] + X_TOLERANCE
+                            or abs(top - prev[3]) > Y_TOLERANCE)
+            else:
+                new_word = (top < prev[3] or top > prev[4] + Y_TOLERANCE
+                            or abs(x0 - prev[1]) > X_TOLERANCE)
+            if new_word:
+                words.append(word)
+                word = []
+        word.append(char)
+    if word:
+        words.append(word)
+    return [("".join(LIGATURES.get(char[0], char[0]) for char in word), min(char[3] for char in word))
+            for word in words]
+
+
+def chars_to_text(chars: list[tuple]) -> str:
+    # Same text as pdfplumber's extract_text() with its default settings
+    words = []
+    for upright, group in itertools.groupby(chars, key=lambda char: char[5]):
+        group = list(group)
+        # Upright text: lines by top, read left to right. Rotated text:
+        # lines by x0, read top to bottom.
+        line_key, tolerance = (3, Y_TOLERANCE) if upright else (1, X_TOLERANCE)
+        ids = _cluster_ids((char[line_key] for char in group), tolerance)
+        group.sort(key=lambda char: ids[char[line_key]])
+        for _, line in itertools.groupby(group, key=lambda char: ids[char[line_key]]):
+            if upright:
+                line = sorted(line, key=lambda char: char[1])
+            else:
+                line = sorted(line, key=lambda char: (char[3], char[4]))
+            words.extend(_words(line, upright))
+
+    # Words are then put on lines by their tops, keeping their order
+    ids = _cluster_ids((top for _, top in words), Y_TOLERANCE)
+    return "\n".join(" ".join(text for text, _ in line)
+                     for _, line in itertools.groupby(words, key=lambda word: ids[word[1]]))
+
+
+class PopplerDocument():
+    # poppler's `pdftotext -layout` in a subprocess, run once over the whole
+    # report. Its column spacing and blank lines are collapsed to match
+    # the single spaced lines of the other backends.
+
+    def __init__(self, source: PDFSource):
+        if shutil.which(PDFTOTEXT) is None:
+            raise RuntimeError(f"{PDFTOTEXT} not found, install poppler-utils to use the poppler backend")
+        if isinstance(source, (str, os.PathLike)):
+            output = self._run(os.fspath(source))
+        else:
+            contents = source.read() if hasattr(source, "read") else bytes(source)
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+                f.write(contents)
+                f.flush()
+                output = self._run(f.name)
+        # Every page ends with a form feed
+        self.pages = output.split("\f")[:-1]
+        self.page_count = len(self.pages)
+
+    def _run(self, path: str) -> str:
+        result = subprocess.run([PDFTOTEXT, "-layout", "-enc", "UTF-8", path, "-"],
+                                capture_output=True, check=True)
+        return result.stdout.decode("utf-8")
+
+    def page_text(self, i: int) -> str:
+        lines = (WHITESPACE_PATTERN.sub(" ", line).strip() for line in self.pages[i].split("\n"))
+        return "\n".join(line for line in lines if line)
+
+    def close(self):
+        self.pages = []
+
+
+BACKENDS = {
+    "pdfplumber": PdfplumberDocument,
+    "pdfminer": PdfminerDocument,
+    "poppler": PopplerDocument,
+}
+
+
+def available_backends() -> list[str]:
+    # poppler needs the pdftotext binary (poppler-utils in the Docker image)
+    return [name for name in BACKENDS if name != "poppler" or shutil.which(PDFTOTEXT)]
+
+
+def open_document(source: PDFSource, backend: str | None = None):
+    # Open a report with the named backend (default WJIV_EXTRACT_BACKEND)
+    backend = backend or EXTRACT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown extraction backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](source)
@@ -1,48 +1,88 @@
-from analyze_pdf import ReportScraper
-import os  
-import polars as pl 
-
-english_files = [] 
-spanish_files = []
-
-for file in os.scandir("data"):  
-    if file.is_file():  # check if it's a file
-        r = ReportScraper(path=file.path)
-        r.get_headers()
-        r.set_id(id_key="Name") # name" in report is actually an id
-        r.get_test_scores()
-        r.get_observations()
-        
-        if r.language == "English":
-            english_files.append(r.data)
-        else:
-            spanish_files.append(r.data)
-
-# Make dataframes from english and spanish lists of data dicts
-en_df = pl.DataFrame(english_files) 
-sp_df = pl.DataFrame(spanish_files) 
-
-# Merge english and spanish df's 
-df = en_df.join(sp_df, on="ID", how="full", coalesce=True)
-
-# Coalesce duplicate header information (stored as *_right columns)
-right_cols = [col for col in df.columns if col.endswith("_right")]
-
-# Right column replacement expressions
-replacements = [
-    pl.coalesce([pl.col(col.replace("_right", "")), pl.col(col)]).alias(col.replace("_right", ""))
-    for col in right_cols
-]
-# Apply replacements
-df = df.with_columns(replacements)
-
-# Drop the duplicate columns
-df = df.drop(right_cols)
-
-# Move id column to front 
-df = df.select(pl.col("ID"), pl.all().exclude("ID"))
-
-# Sort, Print, Save
-df = df.unique().sort(["ID"])
-print(df)
-df.write_csv("output.csv", separator=",")
+
+from parse_pool import parse_reports
+from report_cache import get_cache
+from archives import expand_archives
+from incremental import IncrementalStore
+from result_store import STORE_PATH, ResultStore
+from report_profile import SORT_KEYS, dump_profile, print_summary, profile_report
+import argparse
+import os
+from typed_output import FORMATS, build_frame, write_frame
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Scrape every WJIV report in data/ (PDFs, or zip/tar "
+                                                 "archives of them) into output.csv")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only parse files that are new or changed since the last incremental run")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="with --incremental, forget previous results and parse everything")
+    parser.add_argument("--store", default=STORE_PATH or None,
+                        help="also save the results to this SQLite result store (default WJIV_STORE_PATH), "
+                             "see result_store.py")
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="long writes one row per value; parquet and arrow (Arrow IPC) "
+                             "get typed numeric/date columns")
+    parser.add_argument("--profile", metavar="PDF",
+                        help="instead, profile parsing this one report: stage times, pages and lines "
+                             "scanned, and hot spots (see report_profile.py)")
+    parser.add_argument("--profile-sort", choices=SORT_KEYS, default="cumulative",
+                        help="order of the printed profile")
+    parser.add_argument("--profile-output", metavar="FILE",
+                        help="with --profile, also save the profile as a .prof file (pstats, snakeviz)")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        summary, stats = profile_report(args.profile, sort=args.profile_sort)
+        print_summary(summary)
+        if args.profile_output:
+            with open(args.profile_output, "wb") as f:
+                f.write(dump_profile(stats))
+        return
+
+    # Only files; absolute paths, since pool workers may have another cwd
+    paths = [os.path.abspath(file.path) for file in os.scandir("data") if file.is_file()]
+
+    # Parse reports on the worker pool (see WJIV_PARSE_WORKERS). Archives
+    # are read a member at a time, straight into the parser.
+    if args.incremental:
+        store = IncrementalStore()
+        if args.full_rebuild:
+            store.clear()
+        reports, counts = store.update(paths)
+        print(f"Incremental: {counts['parsed']} parsed, {counts['unchanged']} unchanged, "
+              f"{counts['removed']} removed")
+    else:
+        archives = []
+        reports = parse_reports(expand_archives(paths, archives))
+        for archive in archives:
+            print(f"{os.path.basename(archive.path)}: {len(archive.names)} reports, "
+                  f"{len(archive.skipped)} members skipped")
+            for name, reason in archive.skipped:
+                print(f"  skipped {name} ({reason})")
+
+    if args.store:
+        store = ResultStore(args.store)
+        print(f"Result store: {store.upsert(reports)} reports saved to {args.store}")
+        store.close()
+
+    # Merge english and spanish reports into one row per ID (or keep the
+    # long format for --format long)
+    df = build_frame(reports, args.format)
+
+    # Print, Save
+    print(df)
+    extension, _ = FORMATS[args.format]
+    with open(f"output.{extension}", "wb") as f:
+        f.write(write_frame(df, args.format))
+
+    # Report how many files were served from the parse cache
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Parse cache: {stats['hits']} hits, {stats['misses']} misses")
+
+
+# Guard is required so worker processes can import this module safely
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+from analyze_pdf import PARSER_VERSION, ReportResult
+from extract_backends import EXTRACT_BACKEND
+from archives import ArchiveReports, is_archive
+from parse_pool import parse_reports
+
+# Where generate_csv.py --incremental keeps its manifest and parsed results
+STORE_DIR = os.environ.get("WJIV_INCREMENTAL_DIR", ".wjiv_incremental")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IncrementalStore():
+    # Remembers every report already parsed from the data directory.
+    #
+    # manifest.json maps each file path to its size, mtime and content hash;
+    # results/<hash>.json holds the parsed results (as a dict) for that
+    # content (a list of them for a zip/tar archive). A file is only parsed
+    # again when its size or mtime changed and its hash no longer matches;
+    # deleted files drop out of the manifest.
+
+    def __init__(self, directory: str = STORE_DIR):
+        self.directory = directory
+        self.results_dir = os.path.join(directory, "results")
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        os.makedirs(self.results_dir, exist_ok=True)
+
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                stored = json.load(f)
+            # Results from another parser version (or extraction backend)
+            # can't be reused; they are named by content hash alone, so
+            # delete them rather than just forgetting the manifest
+            if (stored.get("parser_version") == PARSER_VERSION
+                    and stored.get("extract_backend", "pdfplumber") == EXTRACT_BACKEND):
+                self.manifest = stored["files"]
+            else:
+                self._remove_unused_results()
+
+    def _result_path(self, content_hash: str) -> str:
+        return os.path.join(self.results_dir, f"{content_hash}.json")
+
+    def update(self, paths: list[str]) -> tuple[list[ReportResult], dict]:
+        # Bring the store in line with `paths`, parsing only new or changed
+        # files. Returns the report results in the order of paths, and counts of
+        # unchanged/parsed/removed files.
+        entries = {}
+        to_parse = []
+        for path in paths:
+            stat = os.stat(path)
+            entry = self.manifest.get(path)
+            if not (entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime):
+                entry = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": file_hash(path)}
+            entries[path] = entry
+            if not os.path.exists(self._result_path(entry["hash"])):
+                to_parse.append(path)
+
+        pdfs = [path for path in to_parse if not is_archive(path)]
+        parsed = dict(zip(pdfs, parse_reports(pdfs)))
+        for path in to_parse:
+            if path in parsed:
+                data = parsed[path].to_dict()
+            else:
+                data = [result.to_dict() for result in parse_reports(ArchiveReports(path))]
+            with open(self._result_path(entries[path]["hash"]), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+
+        removed = [path for path in self.manifest if path not in entries]
+        self.manifest = entries
+        self._remove_unused_results()
+        self._save_manifest()
+
+        reports = []
+        for path in paths:
+            with open(self._result_path(entries[path]["hash"]), encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                reports.extend(map(ReportResult.from_dict, data))
+            else:
+                reports.append(ReportResult.from_dict(data))
+        counts = {"unchanged": len(paths) - len(to_parse), "parsed": len(to_parse), "removed": len(removed)}
+        return reports, counts
+
+    def _remove_unused_results(self):
+        in_use = {f"{entry['hash']}.json" for entry in self.manifest.values()}
+        for entry in os.scandir(self.results_dir):
+            if entry.name not in in_use:
+                os.remove(entry.path)
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"parser_version": PARSER_VERSION, "extract_backend": EXTRACT_BACKEND,
+                       "files": self.manifest}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def clear(self):
+        # Forget everything, forcing a full rebuild
+        self.manifest = {}
+        self._remove_unused_results()
+        self._save_manifest()
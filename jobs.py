@@ -0,0 +1,172 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from collections.abc import Iterator
+
+import metrics
+from archives import ArchiveReports, is_archive
+
+# Batch job settings, all overridable from the environment
+JOB_QUEUE_SIZE = int(os.environ.get("WJIV_JOB_QUEUE_SIZE", 16))
+JOB_RUNNERS = int(os.environ.get("WJIV_JOB_RUNNERS", 1))
+JOB_TTL_SECONDS = int(os.environ.get("WJIV_JOB_TTL_SECONDS", 3600))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job():
+    # One uploaded batch of WJIV PDFs and its progress
+
+    def __init__(self, filenames: list[str], paths: list[str],
+                 directory: tempfile.TemporaryDirectory | None = None):
+        self.id = uuid.uuid4().hex
+        self.filenames = filenames
+        self.paths = paths
+        # Temporary directory holding the uploads, removed after the run
+        self.directory = directory
+        self.state = "queued"
+        self.parsed = 0
+        self.errors = []
+        # Name of each report handed to the parser, in order (see sources)
+        self.labels = []
+        # Archive members that were not parsed, with the reason
+        self.skipped = []
+        self.csv = None
+        self.created = time.time()
+        self.finished = None
+
+    def sources(self) -> Iterator[str | bytes]:
+        # The reports to parse, as archives.expand_archives gives them,
+        # naming each one in self.labels as it is handed out: the upload's
+        # filename, or "batch.zip:S1.pdf" for an archive member
+        seen = set()
+        for filename, path in zip(self.filenames, self.paths):
+            if not is_archive(path):
+                self.labels.append(filename)
+                yield path
+                continue
+            reports = ArchiveReports(path, seen)
+            for contents in reports:
+                self.labels.append(f"{filename}:{reports.names[-1]}")
+                yield contents
+            self.skipped.extend({"file": f"{filename}:{name}", "reason": reason}
+                                for name, reason in reports.skipped)
+
+    def status(self) -> dict:
+        # total counts uploaded files; parsed and failed count reports, each
+        # member of an archive on its own
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "total": len(self.filenames),
+            "parsed": self.parsed,
+            "failed": len(self.errors),
+            "errors": self.errors,
+            "skipped": self.skipped,
+        }
+
+
+class JobManager():
+    # Runs WJIV batch jobs in the background. Jobs wait in a bounded queue and
+    # a fixed number of runner tasks feed them through the parse pool; a full
+    # queue rejects new jobs instead of growing without limit.
+
+    def __init__(self, queue_size: int = JOB_QUEUE_SIZE, runners: int = JOB_RUNNERS,
+                 ttl_seconds: int = JOB_TTL_SECONDS):
+        self.queue_size = queue_size
+        self.runner_count = runners
+        self.ttl_seconds = ttl_seconds
+        self.jobs = {}
+        self.queue = None
+        self.runners = []
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.runners = [asyncio.create_task(self._run_jobs()) for _ in range(self.runner_count)]
+
+    async def stop(self):
+        for runner in self.runners:
+            runner.cancel()
+        await asyncio.gather(*self.runners, return_exceptions=True)
+        self.runners = []
+
+    def submit(self, filenames: list[str], paths: list[str],
+               directory: tempfile.TemporaryDirectory | None = None) -> Job:
+        self._purge()
+        job = Job(filenames, paths, directory)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"{self.queue_size} jobs already waiting")
+        self.jobs[job.id] = job
+        metrics.gauge(metrics.JOB_QUEUE_DEPTH, self.queue_depth())
+        return job
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def _purge(self):
+        # Forget finished jobs (and their csv) after ttl_seconds
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [job.id for job in self.jobs.values()
+                       if job.finished and job.finished < cutoff]:
+            del self.jobs[job_id]
+
+    async def _run_jobs(self):
+        while True:
+            job = await self.queue.get()
+            metrics.gauge(metrics.JOB_QUEUE_DEPTH, self.queue_depth())
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Job):
+        # Loaded with the first job, not when the app starts
+        from merge import merge_reports
+        from parse_pool import iter_reports_async
+        from result_store import get_store
+
+        job.state = "running"
+        reports = []
+        try:
+            # A report that fails to parse is recorded and the batch carries
+            # on. Archives are parsed member by member; a result's source was
+            # always handed out (and labelled) before it comes back.
+            results = iter_reports_async(job.sources(), return_exceptions=True)
+            i = 0
+            async for data in results:
+                if isinstance(data, Exception):
+                    # (a failure of the sources themselves has no label)
+                    label = job.labels[i] if i < len(job.labels) else None
+                    job.errors.append({"file": label, "error": f"{type(data).__name__}: {data}"})
+                else:
+                    reports.append(data)
+                    job.parsed += 1
+                i += 1
+
+            store = get_store()
+            if store is not None:
+                await asyncio.to_thread(store.upsert, reports)
+            df = await asyncio.to_thread(merge_reports, reports)
+            job.csv = df.write_csv().encode("utf-8") if not df.is_empty() else b""
+            job.state = "done"
+        except Exception as e:
+            job.errors.append({"file": None, "error": f"{type(e).__name__}: {e}"})
+            job.state = "failed"
+        finally:
+            # Uploads are no longer needed
+            if job.directory is not None:
+                job.directory.cleanup()
+            job.paths = job.directory = None
+            job.finished = time.time()
+
+
+job_manager = JobManager()
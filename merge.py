@@ -0,0 +1,93 @@
+from collections.abc import Mapping
+
+import polars as pl
+
+from analyze_pdf import LONG_COLUMNS, long_records
+
+# Long records with the number of the wide row they belong to
+LONG_SCHEMA = {"row": pl.UInt32, **{column: pl.String for column in LONG_COLUMNS}}
+
+
+def distinct_reports(reports: list[Mapping]) -> list[Mapping]:
+    # Repeated uploads of a report (every value the same) are kept once.
+    # Reports that differ in anything, e.g. a retest of the same ID on
+    # another date, are all kept.
+    seen = set()
+    distinct = []
+    for data in reports:
+        key = tuple(data.items())
+        if key not in seen:
+            seen.add(key)
+            distinct.append(data)
+    return distinct
+
+
+def report_rows(reports: list[Mapping]) -> list[tuple[int, Mapping]]:
+    # (wide row number, report) pairs, as the full join on ID used to pair
+    # them: every English report of an ID with every Spanish report of it,
+    # and reports with no partner in the other language on a row of their
+    # own. English reports come first, so their values win for the header
+    # columns both languages have.
+    reports = distinct_reports(reports)
+    english_files = [data for data in reports if data["Language"] == "English"]
+    spanish_files = [data for data in reports if data["Language"] != "English"]
+    spanish_by_id = {}
+    for data in spanish_files:
+        spanish_by_id.setdefault(data["ID"], []).append(data)
+
+    rows = []
+    row = 0
+    for data in english_files:
+        for partner in spanish_by_id.get(data["ID"]) or [None]:
+            rows.append((row, data))
+            if partner is not None:
+                rows.append((row, partner))
+            row += 1
+    english_ids = {data["ID"] for data in english_files}
+    for data in spanish_files:
+        if data["ID"] not in english_ids:
+            rows.append((row, data))
+            row += 1
+    return rows
+
+
+def long_frame(reports: list[Mapping]) -> pl.LazyFrame:
+    # Every parsed value as one row (see analyze_pdf.long_records), tagged
+    # with its wide row (see report_rows)
+    records = [(row, *record) for row, data in report_rows(reports) for record in long_records(data)]
+    return pl.LazyFrame(records, schema=LONG_SCHEMA, orient="row")
+
+
+def dedupe_long(long: pl.LazyFrame) -> pl.LazyFrame:
+    # One value per wide row and column: the first non-null one, so English
+    # values win over Spanish ones for shared header columns
+    return long.group_by("row", "column", maintain_order=True).agg(
+        pl.col("value").drop_nulls().first(),
+        pl.exclude("value").first(),
+    ).select("row", *LONG_COLUMNS)
+
+
+def pivot_wide(long: pl.LazyFrame) -> pl.DataFrame:
+    # The wide layout: one row per report (or English/Spanish pair), one
+    # column per value, sorted by ID. Columns keep the order they first
+    # appear in (English, then Spanish).
+    df = dedupe_long(long).filter(pl.col("column") != "ID").collect()
+    if df.is_empty():
+        return pl.DataFrame()
+    columns = df.get_column("column").unique(maintain_order=True).to_list()
+    wide = df.pivot(on="column", index=["row", "ID"], values="value", maintain_order=True)
+    return wide.select(["ID"] + columns).sort("ID", maintain_order=True)
+
+
+def merge_reports(reports: list[Mapping]) -> pl.DataFrame:
+    # Combine parsed report results into the wide layout: English and
+    # Spanish reports for the same ID are merged, header columns shared by
+    # both are taken from the English report when present
+    return pivot_wide(long_frame(reports))
+
+
+def long_reports(reports: list[Mapping]) -> pl.DataFrame:
+    # Deduplicated long format, sorted by ID, for the long export (a Spanish
+    # report paired with several English ones is listed once)
+    long = dedupe_long(long_frame(reports)).select(LONG_COLUMNS).unique(maintain_order=True)
+    return long.sort("ID", maintain_order=True).collect()
@@ -0,0 +1,184 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+
+# Instrumentation is off unless WJIV_METRICS=1. When off, every hook below
+# returns straight away (timer() hands back a shared no-op context).
+ENABLED = os.environ.get("WJIV_METRICS", "0") == "1"
+
+# Latency buckets in seconds, from a single page parse up to a large batch
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_capture = threading.local()
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Counter():
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Gauge():
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def set(self, value: float, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Histogram():
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', str(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(key)} {series[-1]}")
+        return lines
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+STAGE_SECONDS = Histogram("wjiv_stage_seconds", "Time spent in each processing stage")
+FILES = Counter("wjiv_files_total", "Files received by each endpoint")
+PAGES = Counter("wjiv_pages_total", "PDF pages extracted")
+BYTES_IN = Counter("wjiv_bytes_in_total", "Bytes uploaded to each endpoint")
+BYTES_OUT = Counter("wjiv_bytes_out_total", "Bytes returned by each endpoint")
+REQUESTS_IN_FLIGHT = Gauge("wjiv_requests_in_flight", "Upload requests currently admitted")
+BYTES_IN_FLIGHT = Gauge("wjiv_bytes_in_flight", "Upload bytes of the requests currently admitted")
+JOB_QUEUE_DEPTH = Gauge("wjiv_job_queue_depth", "WJIV batch jobs waiting to run")
+REJECTIONS = Counter("wjiv_admission_rejections_total", "Upload requests turned away, by reason")
+
+REGISTRY = {metric.name: metric for metric in (STAGE_SECONDS, FILES, PAGES, BYTES_IN, BYTES_OUT,
+                                               REQUESTS_IN_FLIGHT, BYTES_IN_FLIGHT, JOB_QUEUE_DEPTH,
+                                               REJECTIONS)}
+
+
+def _record(metric, method: str, value: float, labels: dict):
+    # Inside capture() observations are buffered instead of recorded
+    buffer = getattr(_capture, "buffer", None)
+    if buffer is not None:
+        buffer.append((metric.name, method, value, labels))
+        return
+    with _lock:
+        getattr(metric, method)(value, **labels)
+
+
+def observe(metric: Histogram, value: float, **labels):
+    if ENABLED:
+        _record(metric, "observe", value, labels)
+
+
+def count(metric: Counter, amount: float = 1, **labels):
+    if ENABLED:
+        _record(metric, "inc", amount, labels)
+
+
+def gauge(metric: Gauge, value: float, **labels):
+    if ENABLED:
+        _record(metric, "set", value, labels)
+
+
+@contextlib.contextmanager
+def _timer(stage: str, labels: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(STAGE_SECONDS, "observe", time.perf_counter() - start, dict(stage=stage, **labels))
+
+
+def timer(stage: str, **labels):
+    # with timer("get_headers"): ...  records into wjiv_stage_seconds
+    if not ENABLED:
+        return _NULL_TIMER
+    return _timer(stage, labels)
+
+
+def timed(stage: str):
+    # Decorator form of timer(). When instrumentation is off the function is
+    # returned unchanged, so there is no overhead at all.
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _timer(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def capture():
+    # Collect observations instead of recording them, e.g. in a pool worker
+    # whose registry the app never sees; hand the list to replay() in the
+    # parent process
+    observations = []
+    _capture.buffer = observations
+    try:
+        yield observations
+    finally:
+        _capture.buffer = None
+
+
+def replay(observations: list):
+    with _lock:
+        for name, method, value, labels in observations:
+            getattr(REGISTRY[name], method)(value, **labels)
+
+
+def render() -> str:
+    # Prometheus text exposition format
+    with _lock:
+        lines = []
+        for metric in REGISTRY.values():
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
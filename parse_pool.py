@@ -0,0 +1,233 @@
+import asyncio
+import multiprocessing
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import metrics
+from analyze_pdf import PDFSource, ReportResult, scrape_report
+from report_cache import cache_key, get_cache
+
+# Number of worker processes used to parse reports. Set WJIV_PARSE_WORKERS=0
+# to parse serially in the calling process instead.
+PARSE_WORKERS = int(os.environ.get("WJIV_PARSE_WORKERS", os.cpu_count() or 1))
+
+# Reports handed to the pool ahead of the one being waited on. Keeps the
+# workers busy while bounding how many reports are held in memory at once.
+WINDOW = max(PARSE_WORKERS, 1) * 2
+
+# Workers are started from a forkserver (spawned where there is none), not
+# forked from the server: it has running threads (asyncio.to_thread,
+# polars' pool), and forking a threaded process can deadlock the child.
+# The forkserver imports the parser once, so new workers start with it.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    MP_CONTEXT = multiprocessing.get_context("forkserver")
+    MP_CONTEXT.set_forkserver_preload(["analyze_pdf"])
+else:
+    MP_CONTEXT = multiprocessing.get_context("spawn")
+
+_pool = None
+# Set by warm_up_pool: every worker runs warm_up as it starts
+_warm_workers = False
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # Pool is created on first use and shared by the app and the CLI. It is
+    # replaced if a worker died (e.g. on a PDF that crashed pdfminer).
+    global _pool
+    if _pool is not None and _pool._broken:
+        _pool.shutdown(wait=False)
+        _pool = None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=MP_CONTEXT,
+                                    initializer=warm_up if _warm_workers else None)
+    return _pool
+
+
+def warm_up() -> list[ReportResult]:
+    # Parse an English and a Spanish synthetic report, so imports and
+    # pdfminer's first-use setup (font metrics, encodings) are paid here
+    # rather than by the first real report. Their stage timings are dropped.
+    import synthetic_reports
+
+    with metrics.capture():
+        return [scrape_report(synthetic_reports.report_pdf("WARMUP", language, pages=2))
+                for language in ("English", "Spanish")]
+
+
+def warm_up_pool() -> list[ReportResult]:
+    # Warm this process (serial parsing, merging), then start every pool
+    # worker, each warming itself before taking work. Blocking; returns the
+    # warm-up results.
+    global _warm_workers
+    reports = warm_up()
+    if PARSE_WORKERS > 0:
+        _warm_workers = True
+        shutdown_pool()
+        pool = get_pool()
+        for future in [pool.submit(os.getpid) for _ in range(PARSE_WORKERS)]:
+            future.result()
+    return reports
+
+
+def _scrape_observed(path: PDFSource) -> tuple[ReportResult, list]:
+    # Worker side of scrape_report when metrics are on: the stage timings are
+    # sent back with the data and recorded by the parent process
+    with metrics.capture() as observations:
+        data = scrape_report(path)
+    return data, observations
+
+
+def _pool_scrape(path: PDFSource):
+    # Submit one report to the pool; the future resolves to its results
+    # (see _scrape_observed)
+    return get_pool().submit(_scrape_observed if metrics.ENABLED else scrape_report, path)
+
+
+def _unwrap(result) -> ReportResult:
+    if metrics.ENABLED:
+        data, observations = result
+        metrics.replay(observations)
+        return data
+    return result
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def _read_source(source: PDFSource) -> bytes:
+    # PDF bytes used for the cache key. Paths are read from disk; in-memory
+    # sources are hashed as they are.
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "read"):
+        position = source.tell()
+        contents = source.read()
+        source.seek(position)
+        return contents
+    return source
+
+
+def _lookup(source: PDFSource) -> tuple[str | None, ReportResult | None]:
+    # Cache key and cached data (None on a miss) of one report
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    key = cache_key(_read_source(source))
+    return key, cache.get(key)
+
+
+def _store(key: str | None, data: ReportResult):
+    cache = get_cache()
+    if cache is not None:
+        cache.put(key, data)
+
+
+def iter_reports(sources: Iterable[PDFSource]) -> Iterator[ReportResult]:
+    # Parse every report, yielding results in the same order as sources.
+    # Each entry can be a path or the PDF itself (see analyze_pdf.PDFSource);
+    # file-like objects only work with WJIV_PARSE_WORKERS=0.
+    # Reports already in the parse cache are not parsed again. sources may
+    # be a generator (e.g. archive members, see archives.py): only WINDOW
+    # reports are taken from it ahead of the one being waited on.
+    sources = iter(sources)
+    pending = deque()  # (source, key, data or future)
+
+    def fill():
+        while len(pending) < WINDOW:
+            source = next(sources, None)
+            if source is None:
+                return
+            key, data = _lookup(source)
+            if data is None and PARSE_WORKERS > 0:
+                pending.append((None, key, _pool_scrape(source)))
+            else:
+                pending.append((source, key, data))
+
+    fill()
+    while pending:
+        source, key, data = pending.popleft()
+        if isinstance(data, Future):
+            data = _unwrap(data.result())
+            _store(key, data)
+        elif data is None:
+            data = scrape_report(source)
+            _store(key, data)
+        fill()
+        yield data
+
+
+def parse_reports(sources: Iterable[PDFSource]) -> list[ReportResult]:
+    return list(iter_reports(sources))
+
+
+async def iter_reports_async(sources: Iterable[PDFSource], return_exceptions: bool = False):
+    # Same as iter_reports, without blocking the event loop: each result
+    # is yielded as soon as it (and every report before it) is parsed.
+    # With return_exceptions=True a report that fails to parse yields its
+    # exception instead of stopping the whole batch.
+    sources = iter(sources)
+    pending = deque()  # (source, key, data or future)
+
+    def take() -> tuple | None:
+        # Next source and its cache lookup; run in a thread, as it may read
+        # and hash a file or decompress an archive member
+        source = next(sources, None)
+        if source is None:
+            return None
+        return (source, *_lookup(source))
+
+    async def fill():
+        while len(pending) < WINDOW:
+            try:
+                entry = await asyncio.to_thread(take)
+            except Exception as e:
+                # Taking the source failed (e.g. its file vanished), not the
+                # parse; it is that source's result. A generator that raised
+                # has nothing more to give, so the next take ends the batch.
+                if not return_exceptions:
+                    raise
+                pending.append((None, None, e))
+                continue
+            if entry is None:
+                return
+            source, key, data = entry
+            if data is None and PARSE_WORKERS > 0:
+                pending.append((None, key, asyncio.wrap_future(_pool_scrape(source))))
+            else:
+                pending.append((source, key, data))
+
+    try:
+        await fill()
+        while pending:
+            source, key, data = pending.popleft()
+            try:
+                if isinstance(data, asyncio.Future):
+                    data = _unwrap(await data)
+                    await asyncio.to_thread(_store, key, data)
+                elif data is None:
+                    # Serial mode: parsed on a thread as the caller asks for it
+                    data = await asyncio.to_thread(scrape_report, source)
+                    await asyncio.to_thread(_store, key, data)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                data = e
+            await fill()
+            yield data
+    finally:
+        # Stop queued work if the caller goes away early
+        for _, _, data in pending:
+            if isinstance(data, asyncio.Future):
+                data.cancel()
+
+
+async def parse_reports_async(sources: Iterable[PDFSource]) -> list[ReportResult]:
+    # Same as parse_reports, without blocking the event loop while waiting
+    return [data async for data in iter_reports_async(sources)]
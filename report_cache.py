@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from analyze_pdf import PARSER_VERSION, ReportResult
+from extract_backends import EXTRACT_BACKEND
+
+# Cache settings, all overridable from the environment
+CACHE_ENABLED = os.environ.get("WJIV_CACHE_ENABLED", "1") != "0"
+CACHE_DIR = os.environ.get("WJIV_CACHE_DIR", ".wjiv_cache")
+CACHE_MAX_BYTES = int(os.environ.get("WJIV_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_MEMORY_ENTRIES = int(os.environ.get("WJIV_CACHE_MEMORY_ENTRIES", 1024))
+
+
+def cache_key(contents: bytes) -> str:
+    # Results depend on the PDF bytes and on the parser (and text
+    # extraction backend) that produced them
+    digest = hashlib.sha256(contents)
+    digest.update(f"\0parser-{PARSER_VERSION}-{EXTRACT_BACKEND}".encode())
+    return digest.hexdigest()
+
+
+class ReportCache():
+    # Parsed report results stored as JSON files (their to_dict()) on local
+    # disk, with an in-memory LRU of ReportResults in front. When the
+    # directory grows past max_bytes the least recently used files are
+    # removed.
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES,
+                 memory_entries: int = CACHE_MEMORY_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.disk_bytes = sum(entry.stat().st_size for entry in os.scandir(directory)
+                              if entry.name.endswith(".json"))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key: str, data: ReportResult):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> ReportResult | None:
+        # Results are shared with the memory LRU, don't modify them
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+
+            path = self._path(key)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = ReportResult.from_dict(json.load(f))
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+
+            os.utime(path)  # mark as recently used for disk eviction
+            self._remember(key, data)
+            self.disk_hits += 1
+            return data
+
+    def put(self, key: str, data: Mapping):
+        if not isinstance(data, ReportResult):
+            data = ReportResult.from_dict(data)
+        with self.lock:
+            self._remember(key, data)
+
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data.to_dict(), f, ensure_ascii=False)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.disk_bytes += os.path.getsize(path) - old_size
+
+            if self.disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used files until back under the size cap
+        entries = sorted((entry for entry in os.scandir(self.directory)
+                          if entry.name.endswith(".json")),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.disk_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.memory.pop(entry.name.removesuffix(".json"), None)
+            self.disk_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self.memory),
+                "disk_bytes": self.disk_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+
+
+def get_cache() -> ReportCache | None:
+    # Shared cache, or None if caching is turned off
+    global _cache
+    if _cache is None and CACHE_ENABLED:
+        _cache = ReportCache()
+    return _cache
@@ -0,0 +1,188 @@
+# Profiles the full ReportScraper pipeline on one report, to find out why a
+# particular PDF parses slowly (or to look at what the parser saw when it
+# parses wrongly). Used by the /debug/profile endpoint (when
+# WJIV_PROFILING=1) and generate_csv.py --profile.
+#
+#   python generate_csv.py --profile data/slow_report.pdf
+#
+# The report is parsed twice: once plainly for the per-stage wall times,
+# then under cProfile with a profile per stage, so the hot spots of
+# get_test_scores and get_observations don't mix with text extraction.
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import time
+
+import metrics
+from analyze_pdf import OBS_SECTIONS, PDFSource, ReportScraper, obs_section_column
+
+# The debug endpoint is off unless WJIV_PROFILING=1
+PROFILING = os.environ.get("WJIV_PROFILING", "0") == "1"
+
+# Stages whose call counts are reported as hot spots
+HOT_SPOT_STAGES = ("get_test_scores", "get_observations")
+
+# pstats sort keys accepted for the printed profile
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+
+class _TimedScraper(ReportScraper):
+    # Adds up the time spent extracting page text, which happens inside
+    # the constructor (or inside get_* when lazy)
+
+    def __init__(self, *args, **kwargs):
+        self.extract_seconds = 0.0
+        super().__init__(*args, **kwargs)
+
+    def _load_pages(self, count: int):
+        start = time.perf_counter()
+        try:
+            return super()._load_pages(count)
+        finally:
+            self.extract_seconds += time.perf_counter() - start
+
+
+def _read(source: PDFSource) -> bytes:
+    # Read once, so both passes parse the same bytes (uploads are streams)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "read"):
+        return source.read()
+    return bytes(source)
+
+
+def _stages(scraper: ReportScraper) -> list[tuple[str, object]]:
+    # The steps of analyze_pdf.scrape_report after opening the report
+    return [("get_headers", scraper.get_headers),
+            ("set_id", lambda: scraper.set_id(id_key="Name")),
+            ("get_test_scores", scraper.get_test_scores),
+            ("get_observations", scraper.get_observations)]
+
+
+def time_stages(contents: bytes, backend: str | None = None) -> dict[str, float]:
+    # Wall seconds of each stage, extraction counted on its own
+    start = time.perf_counter()
+    scraper = _TimedScraper(contents, backend=backend)
+    seconds = {"open": time.perf_counter() - start - scraper.extract_seconds}
+    for stage, run in _stages(scraper):
+        extract_before = scraper.extract_seconds
+        start = time.perf_counter()
+        run()
+        seconds[stage] = time.perf_counter() - start - (scraper.extract_seconds - extract_before)
+    start = time.perf_counter()
+    scraper.finish()
+    seconds["finish"] = time.perf_counter() - start
+    seconds["extract"] = scraper.extract_seconds
+    return seconds
+
+
+def _function_name(function: tuple) -> str:
+    # pstats function key (file, line, name) as file:line(name)
+    file, line, name = function
+    if file == "~":
+        return name
+    return f"{os.path.basename(file)}:{line}({name})"
+
+
+def hot_spots(stats: pstats.Stats, limit: int) -> list[dict]:
+    # Most called functions of one stage's profile
+    rows = sorted(stats.stats.items(), key=lambda item: (-item[1][1], -item[1][2]))
+    return [{"function": _function_name(function), "calls": calls, "own_seconds": round(own, 6),
+             "total_seconds": round(total, 6)}
+            for function, (_, calls, own, total, _) in rows[:limit]]
+
+
+def _scan_counts(scraper: ReportScraper) -> dict:
+    # Pages and lines the parser went through, with the size of each
+    # observation section (long ones are the usual slow reports)
+    sections = {}
+    for obs_section in OBS_SECTIONS:
+        first_line = getattr(scraper, f"{obs_section}_first_line", None)
+        if first_line is None:
+            continue
+        prefix = obs_section_column(scraper.language, obs_section) + ":"
+        sections[obs_section] = {
+            "first_line": first_line,
+            "lines": scraper._section_end(first_line) - first_line,
+            "observations": sum(column.startswith(prefix) for column, _ in scraper.result.observations),
+        }
+    scores_line = getattr(scraper, "scores_line", None)
+    return {
+        "pages": {"count": scraper.page_count, "extracted": scraper.pages_loaded},
+        "lines": {
+            "extracted": len(scraper.text),
+            "skipped": len(scraper.skip_lines),
+            "scores": scraper.end_of_scores_line - scores_line if scores_line is not None else 0,
+            "test_rows": sum(map(len, scraper.test_lines.values())),
+        },
+        "observation_sections": sections,
+    }
+
+
+def profile_report(source: PDFSource, backend: str | None = None, sort: str = "cumulative",
+                   limit: int = 25) -> tuple[dict, pstats.Stats]:
+    # Profile one report. Returns a JSON-able summary (stage times, scan
+    # counts, hot spots and the printed profile) and the whole profile for
+    # dump_profile.
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key {sort!r}, expected one of {', '.join(SORT_KEYS)}")
+    contents = _read(source)
+    # Kept out of wjiv_stage_seconds, like the warm-up parses
+    with metrics.capture():
+        seconds = time_stages(contents, backend)
+
+        profiles = {"open": cProfile.Profile()}
+        with profiles["open"]:
+            scraper = ReportScraper(contents, backend=backend)
+        for stage, run in _stages(scraper):
+            profiles[stage] = cProfile.Profile()
+            with profiles[stage]:
+                run()
+        counts = _scan_counts(scraper)
+        result = scraper.finish()
+
+    text = io.StringIO()
+    combined = pstats.Stats(*profiles.values(), stream=text)
+    combined.sort_stats(sort).print_stats(limit)
+    stats = {stage: pstats.Stats(profiles[stage]) for stage in HOT_SPOT_STAGES}
+
+    summary = {
+        "id": result.get("ID"),
+        "language": scraper.language,
+        "values": len(result),
+        "total_seconds": round(sum(seconds.values()), 6),
+        "stages": {stage: round(value, 6) for stage, value in seconds.items()},
+        **counts,
+        "hot_spots": {stage: hot_spots(stats[stage], limit) for stage in HOT_SPOT_STAGES},
+        "profile": text.getvalue(),
+    }
+    return summary, combined
+
+
+def dump_profile(stats: pstats.Stats) -> bytes:
+    # The profile in the .prof format of Stats.dump_stats, for snakeviz
+    # or pstats
+    return marshal.dumps(stats.stats)
+
+
+def print_summary(summary: dict):
+    print(f"{summary['id']} ({summary['language']}): {summary['values']} values in "
+          f"{summary['total_seconds'] * 1000:.1f} ms")
+    print(f"Pages: {summary['pages']['extracted']}/{summary['pages']['count']} extracted")
+    print("Lines: " + ", ".join(f"{count} {name}" for name, count in summary["lines"].items()))
+    for obs_section, section in summary["observation_sections"].items():
+        print(f"  {obs_section}: {section['lines']} lines from line {section['first_line']}, "
+              f"{section['observations']} observations")
+    print("Stages (ms):")
+    for stage, seconds in summary["stages"].items():
+        print(f"  {stage:18s} {seconds * 1000:9.2f}")
+    for stage, rows in summary["hot_spots"].items():
+        print(f"Hot spots in {stage} (calls, own ms, total ms):")
+        for row in rows:
+            print(f"  {row['calls']:8d} {row['own_seconds'] * 1000:9.2f} {row['total_seconds'] * 1000:9.2f}  "
+                  f"{row['function']}")
+    print(summary["profile"])
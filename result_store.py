@@ -0,0 +1,227 @@
+# Optional SQLite store of parsed WJIV results, so subsets can be queried
+# and exported again without the PDFs. /process_wjiv, /wjiv_jobs and
+# generate_csv.py upsert every report they parse when WJIV_STORE_PATH is
+# set (or generate_csv.py --store); a report replaces the stored one with
+# the same ID and language.
+#
+#   python result_store.py list --school "Lincoln Elementary" --from 2024-01-01
+#   python result_store.py export --test "Story Recall" --format parquet
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+
+# Path of the database file; the store is off unless this is set
+STORE_PATH = os.environ.get("WJIV_STORE_PATH", "")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    name TEXT,
+    school TEXT,
+    teacher TEXT,
+    grade TEXT,
+    date_of_testing TEXT,  -- YYYY-MM-DD, so ranges compare as text
+    data TEXT NOT NULL,    -- the report's results as a JSON object, in key order
+    parser_version TEXT,
+    updated_at REAL,
+    PRIMARY KEY (id, language)
+);
+CREATE INDEX IF NOT EXISTS reports_date_of_testing ON reports (date_of_testing);
+CREATE INDEX IF NOT EXISTS reports_school ON reports (school COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS scores (
+    id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    test TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (id, language, test, metric)
+);
+CREATE INDEX IF NOT EXISTS scores_test ON scores (test, id, language);
+"""
+
+# Columns returned by ResultStore.summaries, with the report keys they hold
+SUMMARY_COLUMNS = {"id": "ID", "language": "Language", "name": "Name", "school": "School",
+                   "grade": "Grade", "date_of_testing": "Date of Testing"}
+
+
+def testing_date(value: str | None) -> str | None:
+    # Report dates are MM/DD/YYYY; stored as YYYY-MM-DD (None if unreadable)
+    try:
+        return datetime.datetime.strptime(value, "%m/%d/%Y").date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultStore():
+    # One connection per process, shared by threads behind a lock. WAL mode
+    # lets several server processes read while one of them writes.
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def upsert(self, reports: list[Mapping]) -> int:
+        # Insert or replace each report (and its scores) by ID and language,
+        # in one transaction; reports without an ID are skipped. Returns how
+        # many were stored.
+        from analyze_pdf import PARSER_VERSION, SCORE_COLUMNS
+
+        now = time.time()
+        # The last of several reports with the same ID and language wins
+        latest = {}
+        for data in reports:
+            student_id, language = data.get("ID"), data.get("Language")
+            if student_id and language:
+                latest[student_id, language] = data
+
+        rows = []
+        scores = []
+        for (student_id, language), data in latest.items():
+            rows.append((student_id, language, data.get("Name"), data.get("School"), data.get("Teacher"),
+                         data.get("Grade"), testing_date(data.get("Date of Testing")),
+                         json.dumps(dict(data.items()), ensure_ascii=False), PARSER_VERSION, now))
+            scores.extend((student_id, language, *SCORE_COLUMNS[key], value)
+                          for key, value in data.items() if key in SCORE_COLUMNS)
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM scores WHERE id = ? AND language = ?", [row[:2] for row in rows])
+            self.connection.executemany("""
+                INSERT INTO reports (id, language, name, school, teacher, grade, date_of_testing,
+                                     data, parser_version, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id, language) DO UPDATE SET
+                    name = excluded.name, school = excluded.school, teacher = excluded.teacher,
+                    grade = excluded.grade, date_of_testing = excluded.date_of_testing,
+                    data = excluded.data, parser_version = excluded.parser_version,
+                    updated_at = excluded.updated_at
+                """, rows)
+            self.connection.executemany("INSERT INTO scores VALUES (?, ?, ?, ?, ?)", scores)
+        return len(rows)
+
+    def _select(self, columns: str, ids: list[str] | None = None, school: str | None = None,
+                date_from: str | None = None, date_to: str | None = None, test: str | None = None,
+                language: str | None = None, limit: int | None = None) -> list[tuple]:
+        # Reports matching every filter given, in the order first stored.
+        # Dates are YYYY-MM-DD and inclusive; school and test match ignoring
+        # case.
+        clauses, params = [], []
+        if ids:
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if school:
+            clauses.append("school = ? COLLATE NOCASE")
+            params.append(school)
+        if date_from:
+            clauses.append("date_of_testing >= ?")
+            params.append(str(date_from))
+        if date_to:
+            clauses.append("date_of_testing <= ?")
+            params.append(str(date_to))
+        if language:
+            clauses.append("language = ?")
+            params.append(language)
+        if test:
+            clauses.append("EXISTS (SELECT 1 FROM scores WHERE scores.test = ? "
+                           "AND scores.id = reports.id AND scores.language = reports.language)")
+            # Stored test names are title-cased like SCORE_COLUMNS, so any
+            # spelling (EN_TESTS has "VISUAL PROCESSING (Gv)") matches
+            params.append(test.title())
+        sql = f"SELECT {columns} FROM reports"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY rowid"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def summaries(self, **filters) -> list[dict]:
+        # ID, language, name, school, grade and date of testing of the
+        # matching reports (see _select for the filters)
+        rows = self._select(", ".join(SUMMARY_COLUMNS), **filters)
+        return [dict(zip(SUMMARY_COLUMNS.values(), row)) for row in rows]
+
+    def reports(self, **filters) -> list:
+        # Stored results of the matching reports, ready for
+        # typed_output.build_frame
+        from analyze_pdf import ReportResult
+
+        return [ReportResult.from_dict(json.loads(data)) for data, in self._select("data", **filters)]
+
+    def stats(self) -> dict:
+        with self.lock:
+            reports, students = self.connection.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT id) FROM reports").fetchone()
+        return {"path": self.path, "reports": reports, "students": students}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_store = None
+
+
+def get_store() -> ResultStore | None:
+    # Shared store, or None unless WJIV_STORE_PATH is set
+    global _store
+    if _store is None and STORE_PATH:
+        _store = ResultStore()
+    return _store
+
+
+def main():
+    from typed_output import FORMATS, build_frame, write_frame
+
+    parser = argparse.ArgumentParser(description="Query or export WJIV results saved in the SQLite result store")
+    parser.add_argument("command", choices=("list", "export", "stats"))
+    parser.add_argument("--store", default=STORE_PATH or None, required=not STORE_PATH,
+                        help="database file (default WJIV_STORE_PATH)")
+    parser.add_argument("--id", action="append", dest="ids", help="student ID (repeat for several)")
+    parser.add_argument("--school")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat,
+                        help="first date of testing, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat,
+                        help="last date of testing, YYYY-MM-DD")
+    parser.add_argument("--test", help="only reports with scores for this test, e.g. \"Story Recall\"")
+    parser.add_argument("--language", choices=("English", "Spanish"))
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="export format (see generate_csv.py)")
+    parser.add_argument("--output", help="export file (default output.<format>)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        parser.error(f"no result store at {args.store}")
+    store = ResultStore(args.store)
+    filters = {"ids": args.ids, "school": args.school, "date_from": args.date_from,
+               "date_to": args.date_to, "test": args.test, "language": args.language}
+
+    if args.command == "stats":
+        print(store.stats())
+    elif args.command == "list":
+        for row in store.summaries(**filters):
+            print("\t".join("" if value is None else str(value) for value in row.values()))
+    else:
+        reports = store.reports(**filters)
+        extension, _ = FORMATS[args.format]
+        output = args.output or f"output.{extension}"
+        with open(output, "wb") as f:
+            f.write(write_frame(build_frame(reports, args.format), args.format))
+        print(f"Exported {len(reports)} reports to {output}")
+
+
+if __name__ == "__main__":
+    main()
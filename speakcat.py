@@ -0,0 +1,382 @@
+import asyncio
+import io
+import math
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+
+import fastexcel
+import numpy as np
+import polars as pl
+import regex as re
+import xlsxwriter
+
+import metrics
+
+STUDY_COLUMN = "StudyID"
+SCORE_COLUMN = "overall_total_score"
+TIMESTAMP_COLUMN = "submit_timestamp"
+
+# Strings pandas.read_excel reads as missing, so these cells stay empty in
+# the cleaned workbook as they did when it was built with pandas
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# Number formats pandas' to_excel gives datetime and timedelta cells
+DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+TIMEDELTA_FORMAT = "0"
+
+INVALID_SHEET_CHARS = re.compile(r'[\[\]\:\*\?\/\\]')
+
+# Size of the pieces a streamed workbook is sent in
+CHUNK_SIZE = 64 * 1024
+
+READ_OPTIONS = {"engine": "calamine", "drop_empty_rows": False, "drop_empty_cols": False}
+
+
+def read_speakcat(contents: bytes | str, filename: str = "") -> pl.DataFrame:
+    # contents: the file's bytes or its path. CSV and Parquet exports of the
+    # same data skip the (slow) Excel parse.
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return _normalize(pl.read_csv(contents, null_values=NA_VALUES, infer_schema_length=None))
+    if extension == ".parquet":
+        return _normalize(pl.read_parquet(contents))
+    return read_excel(contents)
+
+
+def read_excel(contents: bytes | str) -> pl.DataFrame:
+    # First sheet, read with calamine (fastexcel). Columns holding one type
+    # of cell come back typed. calamine can only give a column that mixes
+    # numbers and text as text (numbers rounded to 10 decimals), so for
+    # those the exact numbers are read again and kept alongside, as a
+    # struct {number, text} with number set for the numeric cells.
+    try:
+        return _normalize(pl.read_excel(contents, read_options={"dtype_coercion": "strict"}, **READ_OPTIONS))
+    except fastexcel.UnsupportedColumnTypeCombinationError:
+        pass
+
+    df = _normalize(pl.read_excel(contents, **READ_OPTIONS))
+    text_columns = [col for col, dtype in df.schema.items() if dtype == pl.String]
+    numbers = pl.read_excel(contents, columns=text_columns,
+                            read_options={"dtypes": dict.fromkeys(text_columns, "float")}, **READ_OPTIONS)
+    mixed = [col for col in text_columns if 0 < numbers[col].count() < df[col].count()]
+    return df.with_columns(
+        pl.struct(number=numbers[col], text=pl.col(col)).alias(col) for col in mixed
+    )
+
+
+def _normalize(df: pl.DataFrame) -> pl.DataFrame:
+    # Match what pandas.read_excel gave: date-only cells as datetimes, and
+    # NA_VALUES as missing
+    return df.with_columns(
+        pl.col(pl.Date).cast(pl.Datetime("ms")),
+        pl.when(~pl.col(pl.String).is_in(NA_VALUES)).then(pl.col(pl.String)).name.keep(),
+    )
+
+
+def _text(col: str, dtype: pl.DataType) -> pl.Expr:
+    if isinstance(dtype, pl.Struct):
+        return pl.col(col).struct.field("text")
+    return pl.col(col)
+
+
+def _numeric(col: str, dtype: pl.DataType) -> pl.Expr:
+    # Like pd.to_numeric(errors="coerce"): numbers, or text that parses as
+    # one; everything else is missing
+    if dtype == pl.String or isinstance(dtype, pl.Struct):
+        parsed = _text(col, dtype).str.strip_chars().cast(pl.Float64, strict=False)
+        if isinstance(dtype, pl.Struct):
+            parsed = pl.coalesce(pl.col(col).struct.field("number"), parsed)
+        return parsed.fill_nan(None)
+    return pl.col(col).cast(pl.Float64, strict=False).fill_nan(None)
+
+
+def is_test_account(schema: pl.Schema) -> pl.Expr | None:
+    # Rows with "test" in any email/ID/identifier column are test accounts
+    # (only text columns can contain it)
+    columns = [col for col in schema
+               if "email" in col.lower() or "ID" in col or "identifier" in col]
+    checks = [
+        _text(col, schema[col]).str.to_lowercase().str.contains("test", literal=True).fill_null(False)
+        for col in columns
+        if schema[col] == pl.String or isinstance(schema[col], pl.Struct)
+    ]
+    return pl.any_horizontal(checks) if checks else None
+
+
+def clean_speakcat(df: pl.DataFrame) -> pl.LazyFrame:
+    # Drop test accounts, newest submissions first (ties keep their order)
+    cleaned = df.lazy()
+    test_account = is_test_account(df.schema)
+    if test_account is not None:
+        cleaned = cleaned.filter(~test_account)
+
+    timestamp = pl.col(TIMESTAMP_COLUMN)
+    if df.schema[TIMESTAMP_COLUMN] == pl.String:
+        timestamp = timestamp.str.to_datetime()
+    return cleaned.with_columns(timestamp).sort(TIMESTAMP_COLUMN, descending=True, nulls_last=True,
+                                                maintain_order=True)
+
+
+def study_averages(cleaned: pl.LazyFrame, schema: pl.Schema) -> dict:
+    # Mean score of every study, from one group-by. Like pandas' mean the sum
+    # is numpy's (pairwise, missing scores as 0) over the score count, which
+    # keeps the averages identical to the last digit.
+    score = _numeric(SCORE_COLUMN, schema[SCORE_COLUMN])
+    groups = cleaned.group_by(STUDY_COLUMN, maintain_order=True).agg(
+        score.fill_null(0.0).alias("scores"),
+        score.count().alias("count"),
+    ).collect()
+    return {
+        study: float(np.sum(scores)) / count if count else None
+        for study, scores, count in groups.iter_rows()
+    }
+
+
+def sheet_name(study) -> str:
+    return INVALID_SHEET_CHARS.sub('', str(study))[:31]
+
+
+def _cell(value) -> tuple[object, str | None]:
+    # The value and number format DataFrame.to_excel writes for a cell
+    if isinstance(value, dict):
+        value = value["number"] if value["number"] is not None else value["text"]
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None, None
+        if math.isinf(value):
+            return ("inf" if value > 0 else "-inf"), None
+    elif isinstance(value, datetime):
+        return value, DATETIME_FORMAT
+    elif isinstance(value, timedelta):
+        return value.total_seconds() / 86400, TIMEDELTA_FORMAT
+    return value, None
+
+
+def average_row(average: float | None) -> dict:
+    return {"Organization": "Average Score", SCORE_COLUMN: average}
+
+
+def write_sheet(workbook: xlsxwriter.Workbook, name: str, df: pl.DataFrame, extra_row: dict | None = None):
+    # One sheet: a header row, the rows of df, and optionally one more row
+    # (for study sheets the average_row, adding any column it names that df
+    # doesn't have, as pd.concat does)
+    columns = df.columns
+    if extra_row is not None:
+        columns = columns + [column for column in extra_row if column not in columns]
+
+    # Same worksheet for a repeated name, as pd.ExcelWriter does
+    worksheet = workbook.get_worksheet_by_name(name) or workbook.add_worksheet(name)
+    formats = {}
+    for col, column in enumerate(columns):
+        worksheet.write(0, col, column)
+
+    # Column by column, the order to_excel writes cells in, so the shared
+    # strings table comes out the same
+    for col, column in enumerate(columns):
+        values = df.get_column(column).to_list() if column in df.columns else [None] * df.height
+        if extra_row is not None:
+            values.append(extra_row.get(column))
+        for row, value in enumerate(values, start=1):
+            write_cell(workbook, formats, worksheet, row, col, value)
+
+
+def write_cell(workbook: xlsxwriter.Workbook, formats: dict, worksheet, row: int, col: int, value):
+    value, num_format = _cell(value)
+    if value is None:
+        return
+    if num_format is None:
+        worksheet.write(row, col, value)
+        return
+    if num_format not in formats:
+        formats[num_format] = workbook.add_format({"num_format": num_format})
+    worksheet.write(row, col, value, formats[num_format])
+
+
+def constant_memory_fits(sheet_count: int) -> bool:
+    # xlsxwriter's constant_memory mode keeps a temporary file open for
+    # every worksheet until the workbook is closed. Only use it when that
+    # leaves at least half of the process's free file descriptors to the
+    # rest of the server.
+    try:
+        import resource
+    except ImportError:
+        # Not on Windows, which has no such per-process limit
+        return True
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return True
+    try:
+        in_use = len(os.listdir("/proc/self/fd"))
+    except OSError:
+        in_use = 0
+    return sheet_count <= (soft_limit - in_use) // 2
+
+
+def write_workbook_streaming(output, cleaned: pl.DataFrame, averages: dict):
+    # The same sheets in one pass over the cleaned rows, without a frame per
+    # study: each row goes to the end of its study's sheet (and of "Last
+    # Week"), and xlsxwriter's constant_memory mode flushes every sheet row
+    # by row to a temporary file, so only the input is held in memory.
+    # Strings are written inline instead of to a shared strings table, and
+    # studies whose sheet names collide share one sheet. With more studies
+    # than constant_memory_fits allows, the sheets are kept in memory
+    # instead (xlsxwriter's default mode), which needs no open files.
+    studies = cleaned.get_column(STUDY_COLUMN).drop_nulls().unique()
+    sheet_count = 1 + len({sheet_name(study) for study in studies})
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": constant_memory_fits(sheet_count)})
+    formats = {}
+    sheets = {}  # sheet name -> [worksheet, next row]
+
+    def sheet(name: str, columns: list[str]) -> list:
+        if name not in sheets:
+            worksheet = workbook.add_worksheet(name)
+            for col, column in enumerate(columns):
+                worksheet.write(0, col, column)
+            sheets[name] = [worksheet, 1]
+        return sheets[name]
+
+    def append(target: list, values):
+        worksheet, row = target
+        for col, value in enumerate(values):
+            write_cell(workbook, formats, worksheet, row, col, value)
+        target[1] += 1
+
+    columns = cleaned.columns
+    study_columns = columns + [column for column in average_row(None) if column not in columns]
+    last_week = sheet("Last Week", columns)
+    week_prior = datetime.now() - timedelta(weeks=1)
+    timestamp_col = columns.index(TIMESTAMP_COLUMN)
+    study_col = columns.index(STUDY_COLUMN)
+
+    for values in cleaned.iter_rows():
+        if values[timestamp_col] is not None and values[timestamp_col] > week_prior:
+            append(last_week, values)
+        if values[study_col] is not None:
+            append(sheet(sheet_name(values[study_col]), study_columns), values)
+
+    for study, average in averages.items():
+        if study is not None:
+            extra_row = average_row(average)
+            append(sheets[sheet_name(study)], [extra_row.get(column) for column in study_columns])
+    workbook.close()
+
+
+def prepare_speakcat(contents: bytes | str, filename: str = "") -> tuple[pl.DataFrame, dict]:
+    # The cleaned rows and each study's average score
+    with metrics.timer("read_excel", endpoint="process_speakcat_excel"):
+        df = read_speakcat(contents, filename)
+
+    with metrics.timer("clean", endpoint="process_speakcat_excel"):
+        cleaned = clean_speakcat(df).collect()
+        averages = study_averages(cleaned.lazy(), cleaned.schema)
+    return cleaned, averages
+
+
+def clean_speakcat_fileobj(fileobj, filename: str = "") -> io.BytesIO:
+    return speakcat_workbook(fileobj.read(), filename)
+
+
+def speakcat_workbook(contents: bytes | str, filename: str = "") -> io.BytesIO:
+    # Cleaned workbook: a "Last Week" sheet of the past week's submissions,
+    # then one sheet per study with the study's average score
+    cleaned, averages = prepare_speakcat(contents, filename)
+    last_week = cleaned.filter(pl.col(TIMESTAMP_COLUMN) > datetime.now() - timedelta(weeks=1))
+    studies = cleaned.filter(pl.col(STUDY_COLUMN).is_not_null()).partition_by(
+        STUDY_COLUMN, maintain_order=True, as_dict=True)
+
+    output = io.BytesIO()
+    with metrics.timer("write_excel", endpoint="process_speakcat_excel"):
+        workbook = xlsxwriter.Workbook(output)
+        write_sheet(workbook, "Last Week", last_week)
+        for (study,), study_df in studies.items():
+            write_sheet(workbook, sheet_name(study), study_df, average_row(averages[study]))
+        workbook.close()
+
+    output.seek(0)
+    return output
+
+
+class ChunkPipe(io.RawIOBase):
+    # Unseekable file the streaming workbook is written to from a worker
+    # thread. xlsxwriter zips the workbook into it at close(), and the zip
+    # is handed to stream_speakcat in CHUNK_SIZE pieces as it is written.
+    # The queue is small, so a slow client holds the writer back.
+
+    def __init__(self):
+        self.chunks = queue.Queue(maxsize=4)
+        self.buffer = bytearray()
+        self.cancelled = threading.Event()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.cancelled.is_set() and not self.buffer:
+            # Already stopped (zipfile still writes its end record from
+            # __del__)
+            return len(data)
+        self.buffer += data
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def finish(self):
+        if self.buffer:
+            self._put(bytes(self.buffer))
+        self._put(None)
+
+    def abort(self):
+        # End the stream early, the workbook couldn't be written
+        self._put(None)
+
+    def _put(self, chunk: bytes | None):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        self.buffer.clear()
+        raise OSError("SPEAKCAT download was cancelled")
+
+    def get(self) -> bytes | None:
+        while not self.cancelled.is_set():
+            try:
+                return self.chunks.get(timeout=0.5)
+            except queue.Empty:
+                pass
+        return None
+
+
+async def stream_speakcat(cleaned: pl.DataFrame, averages: dict):
+    # Async generator of xlsx chunks, written by write_workbook_streaming on
+    # a worker thread
+    pipe = ChunkPipe()
+
+    def write():
+        try:
+            with metrics.timer("write_excel", endpoint="process_speakcat_excel"):
+                write_workbook_streaming(pipe, cleaned, averages)
+            pipe.finish()
+        except Exception:
+            if pipe.cancelled.is_set():
+                # The client went away, nobody to tell
+                return
+            pipe.abort()
+            raise
+
+    writer = asyncio.create_task(asyncio.to_thread(write))
+    try:
+        while (chunk := await asyncio.to_thread(pipe.get)) is not None:
+            yield chunk
+        # Raises if the workbook couldn't be written
+        await writer
+    finally:
+        # Client went away: stop the writer thread
+        pipe.cancelled.set()
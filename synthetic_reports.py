@@ -0,0 +1,226 @@
+# Synthetic WJIV / Batería reports for benchmarking, laid out the way
+# ReportScraper expects real ones: header rows, TABLE OF SCORES, the three
+# observation sections and "N of M" page footers. No real student data.
+#
+#   python synthetic_reports.py data --count 200 --pages 3
+
+import argparse
+import os
+import random
+
+from analyze_pdf import (
+    EN_TESTS,
+    SP_TESTS,
+    EN_OBS_SECTION_HEADERS,
+    SP_OBS_SECTION_HEADERS,
+    EN_PROFICIENCY_LEVELS_WITH_WHITESPACE,
+    PAGE_HEADER_LINES,
+    POOR_SAMPLE_PREFIXES,
+)
+
+# Lines of text that fit on one synthetic page (including page header/footer)
+LINES_PER_PAGE = 48
+
+EN_TITLE = "Woodcock-Johnson IV Comprehensive Report"
+SP_TITLE = "Batería IV Woodcock-Muñoz Informe de puntuaciones"
+
+EN_OBS_LABELS = [
+    "Conversational Proficiency",
+    "Cooperation",
+    "Activity",
+    "Attention and Concentration",
+    "Self-Confidence",
+    "Care in Responding",
+    "Response to Difficult Tasks",
+]
+
+SP_OBS_LABELS = [
+    "Competencia conversacional",
+    "Cooperación",
+    "Actividad",
+    "Atención y concentración",
+    "Confianza en sí mismo",
+    "Cuidado al responder",
+    "Respuesta a tareas difíciles",
+]
+
+OBS_VALUES = [
+    "Typical for age/grade",
+    "Appeared fatigued near the end of the session",
+    "Attentive to the tasks",
+    "Exceptionally cooperative throughout the examination",
+    "Responded carefully to most items, with some hesitation on",
+]
+
+OBS_CONTINUATIONS = [
+    "the more difficult items",
+    "harder tasks later in the session",
+]
+
+
+def _pdf_string(text: str) -> bytes:
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + escaped.encode("cp1252") + b")"
+
+
+def render_pdf(pages: list[list[str]]) -> bytes:
+    # Minimal single-font PDF writer: one text line per row, top to bottom.
+    # Helvetica with WinAnsiEncoding covers the accented Spanish characters.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # Pages dictionary, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for lines in pages:
+        ops = [b"BT /F1 9 Tf"]
+        for row, line in enumerate(lines):
+            ops.append(b"1 0 0 1 36 %d Tm " % (770 - row * 15) + _pdf_string(line) + b" Tj")
+        ops.append(b"ET")
+        stream = b"\n".join(ops)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Contents %d 0 R /Resources << /Font << /F1 3 0 R >> >> >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _score_line(test: str, language: str, rng: random.Random) -> str:
+    w = rng.randint(440, 520)
+    ae = f"{rng.randint(5, 12)}-{rng.randint(0, 11)}"
+    rpi = f"{rng.randint(20, 99)}/90"
+    ss = rng.randint(70, 130)
+    band = f"{ss} ({ss - 7}-{ss + 7})"
+    if language == "English":
+        proficiency = rng.choice(["Average", "Limited", "Advanced"] + EN_PROFICIENCY_LEVELS_WITH_WHITESPACE)
+        return f"{test} {w} {ae} {rpi} {proficiency} {band} {rng.randint(1, 99)} {rng.randint(30, 70)}"
+    return f"{test} {w} {ae} {rpi} {band}"
+
+
+def _obs_lines(labels: list[str], rng: random.Random, poor_sample: str | None = None) -> list[str]:
+    lines = []
+    if poor_sample:
+        # Long "reason for poor sample" observation, wrapped onto two lines
+        lines.append(f"{poor_sample} Achievement may not be valid: Examinee was")
+        lines.append("distracted by noise outside the testing room")
+    for label in labels:
+        value = rng.choice(OBS_VALUES)
+        lines.append(f"{label}: {value}")
+        if value.endswith(" on"):
+            lines.append(rng.choice(OBS_CONTINUATIONS))
+    return lines
+
+
+def report_lines(student_id: str, language: str = "English", pages: int = 3, seed: int = 0) -> list[list[str]]:
+    """Text of one synthetic WJIV/Batería report, as a list of lines per page."""
+    rng = random.Random(seed)
+    english = language == "English"
+    tests = EN_TESTS if english else SP_TESTS
+    obs_headers = EN_OBS_SECTION_HEADERS if english else SP_OBS_SECTION_HEADERS
+    obs_labels = EN_OBS_LABELS if english else SP_OBS_LABELS
+    title = EN_TITLE if english else SP_TITLE
+
+    header_rows = [
+        f"Name: {student_id} Student School: Lincoln Elementary",
+        f"Date of Birth: 0{rng.randint(1, 9)}/1{rng.randint(0, 9)}/2016 Teacher: Ms. Rivera",
+        f"Age: {rng.randint(5, 9)} years, {rng.randint(0, 9)} months Grade: {rng.randint(1, 3)}",
+        f"Sex: {rng.choice(['Female', 'Male'])} ID: {rng.randint(100000, 999999)}",
+        f"Date of Testing: 0{rng.randint(1, 9)}/1{rng.randint(0, 9)}/2024 Examiners: J. Doe",
+    ]
+
+    scores = ["TABLE OF SCORES"] + [_score_line(test, language, rng) for test in tests]
+    sections = [[header] + _obs_lines(obs_labels, rng) for header in obs_headers]
+    if rng.random() < 0.25:
+        poor_sample = POOR_SAMPLE_PREFIXES[0] if english else POOR_SAMPLE_PREFIXES[1]
+        sections[1] = [obs_headers[1]] + _obs_lines(obs_labels, rng, poor_sample)
+
+    # Pad the last observation section until the report fills the requested
+    # number of pages
+    first_page_room = LINES_PER_PAGE - 1 - len(header_rows) - 1
+    page_room = LINES_PER_PAGE - PAGE_HEADER_LINES - 1
+    target = first_page_room + page_room * (max(pages, 1) - 1)
+    filler = 0
+    while len(scores) + sum(map(len, sections)) < target - page_room // 2:
+        filler += 1
+        sections[-1].append(f"Additional Observation {filler}: {rng.choice(OBS_VALUES[:4])}")
+
+    # English reports list scores before observations, Spanish ones after
+    body = scores + sum(sections, []) if english else sum(sections, []) + scores
+
+    chunks = [body[:first_page_room]]
+    for start in range(first_page_room, len(body), page_room):
+        chunks.append(body[start:start + page_room])
+
+    page_header = [title, header_rows[0], header_rows[1], header_rows[4]]
+    out = []
+    for number, chunk in enumerate(chunks, start=1):
+        top = [title] + header_rows if number == 1 else page_header
+        out.append(top + chunk + [f"{number} of {len(chunks)}"])
+    return out
+
+
+def report_pdf(student_id: str, language: str = "English", pages: int = 3, seed: int = 0) -> bytes:
+    return render_pdf(report_lines(student_id, language, pages, seed))
+
+
+def corpus(count: int, pages: int = 3, spanish_every: int = 3, seed: int = 0) -> list[tuple[str, bytes]]:
+    # (filename, pdf bytes) for `count` reports. Every `spanish_every`-th
+    # report is the Batería report of the same student as the one before it,
+    # so the English/Spanish merge is exercised too.
+    reports = []
+    student = 0
+    for i in range(count):
+        spanish = spanish_every and i % spanish_every == spanish_every - 1
+        if not spanish:
+            student += 1
+        language = "Spanish" if spanish else "English"
+        student_id = f"S{100000 + student}"
+        filename = f"{student_id}_{language}.pdf"
+        reports.append((filename, report_pdf(student_id, language, pages, seed + i)))
+    return reports
+
+
+def write_corpus(directory: str, count: int, pages: int = 3, spanish_every: int = 3,
+                 seed: int = 0) -> list[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for filename, contents in corpus(count, pages, spanish_every, seed):
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as f:
+            f.write(contents)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic WJIV/Batería report PDFs")
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--spanish-every", type=int, default=3,
+                        help="every Nth report is a Spanish one (0 for none)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_corpus(args.directory, args.count, args.pages, args.spanish_every, args.seed)
+    print(f"Wrote {len(paths)} reports to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import io
+from collections.abc import Mapping
+
+import polars as pl
+
+from merge import long_reports, merge_reports
+
+# Output formats: extension and media type. Parquet and Arrow IPC are
+# written from the typed frame, csv from the original all-string one, and
+# long as a csv of the long (tidy) records instead of the wide layout.
+FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "long": ("long.csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+DATE_COLUMNS = ("Date of Birth", "Date of Testing")
+
+
+def _first_number(col: str, dtype) -> pl.Expr:
+    # Leading number of a value like "98 (92-104)", "<0.1" or "90/90"
+    return pl.col(col).str.extract(r"(\d+(?:\.\d+)?)").cast(dtype, strict=False)
+
+
+def typed_columns(col: str) -> list[pl.Expr]:
+    # Typed replacement(s) for one string column of the merged frame
+    if col == "Age":
+        # "123 Months"
+        return [_first_number(col, pl.Int32).alias("Age (Months)")]
+    if col in DATE_COLUMNS:
+        return [pl.col(col).str.strptime(pl.Date, "%m/%d/%Y", strict=False)]
+    if col.endswith(" - W"):
+        return [_first_number(col, pl.Int32)]
+    if col.endswith(" - RPI"):
+        # "85/90": the denominator is always 90, keep the numerator
+        return [_first_number(col, pl.Int32)]
+    if col.endswith(" - SS 95% Band"):
+        # "98 (92-104)" -> SS, band low, band high
+        test = col.removesuffix(" - SS 95% Band")
+        parts = pl.col(col).str.extract_groups(r"^(\d+)\s*\((\d+)-(\d+)\)")
+        return [
+            parts.struct.field("1").cast(pl.Int32, strict=False).alias(f"{test} - SS"),
+            parts.struct.field("2").cast(pl.Int32, strict=False).alias(f"{test} - SS 95% Low"),
+            parts.struct.field("3").cast(pl.Int32, strict=False).alias(f"{test} - SS 95% High"),
+        ]
+    if col.endswith(" - PR"):
+        # Percentile ranks can be "<0.1" or ">99.9"
+        return [_first_number(col, pl.Float64)]
+    if col.endswith(" - T"):
+        return [_first_number(col, pl.Float64)]
+    if col.endswith(" - AE"):
+        # "8-1" (years-months): keep the text, add the total in months
+        parts = pl.col(col).str.extract_groups(r"(\d+)-(\d+)")
+        months = (parts.struct.field("1").cast(pl.Int32, strict=False) * 12 +
+                  parts.struct.field("2").cast(pl.Int32, strict=False))
+        return [pl.col(col), months.alias(f"{col} (Months)")]
+    return [pl.col(col)]
+
+
+def typed_frame(df: pl.DataFrame) -> pl.DataFrame:
+    # Split and convert the numeric parts of every score/header value into
+    # integer, float and date columns; observations and labels stay strings
+    return df.select([expr for col in df.columns for expr in typed_columns(col)])
+
+
+def build_frame(reports: list[Mapping], fmt: str) -> pl.DataFrame:
+    # Long records are only pivoted to the wide layout when it is needed
+    if fmt == "long":
+        return long_reports(reports)
+    return merge_reports(reports)
+
+
+def write_frame(df: pl.DataFrame, fmt: str) -> bytes:
+    if fmt in ("csv", "long"):
+        return df.write_csv().encode("utf-8")
+    buffer = io.BytesIO()
+    if fmt == "parquet":
+        typed_frame(df).write_parquet(buffer)
+    elif fmt == "arrow":
+        typed_frame(df).write_ipc(buffer)
+    else:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    return buffer.getvalue()